@@ -0,0 +1,385 @@
+import numpy as np
+
+# lane order used everywhere: index into TrafficSim.lanes
+LANE_NAMES = ("lr", "rl", "ud", "du")
+
+# light codes
+GREEN = 0
+YELLOW = 1
+RED = 2
+LIGHT_CODES = {"g": GREEN, "y": YELLOW, "r": RED}
+
+# fixed layout numeric version of the step_sim info dict, lights as codes
+STATS_DTYPE = np.dtype([
+    ("vert_light", np.int8),
+    ("horiz_light", np.int8),
+    ("total_wait_time", np.float64),
+    ("average_wait_time", np.float64),
+    ("wait_diff", np.float64),
+    ("num_crashes", np.int64),
+    ("new_crashes", np.int64),
+    ("cars_passed", np.int64),
+    ("cars_per_lane", np.int64, (4,)),
+    ("waiting_rew", np.float64),
+    ("passed_rew", np.float64),
+])
+
+
+class CarArrays:
+    """
+    Car state for one or more intersections kept in flat NumPy arrays.
+
+    Every array is shaped (num_sims, 4, capacity). Slot 0 of a lane is the
+    car closest to the exit and slot count-1 is the last car in the queue,
+    so the car ahead of slot i is always slot i-1.
+
+    The rules are the same as Car.update. Car.update is sequential inside a
+    lane (a follower looks at the already updated car ahead of it), so the
+    batched update repeats the whole pass against the new leaders until
+    nothing changes, which usually takes two or three passes. Lanes that are
+    still changing after that are finished one slot at a time across every
+    lane and sim at once.
+    """
+
+    def __init__(self, num_sims, car_length, car_width, car_spacing, max_speed, accel, decel, stop_pos,
+                 lane_origin, lane_direction, lane_cross, capacity=64):
+        self.num_sims = num_sims
+        self.car_length = car_length
+        self.car_width = car_width
+        self.car_spacing = car_spacing
+        self.max_speed = max_speed
+        self.accel = accel
+        self.decel = decel
+        # stop position of each lane, shape (4,)
+        self.stop_pos = np.asarray(stop_pos, dtype=np.float64)
+
+        #screen geometry used for crashes. along its lane a car covers
+        #origin + direction*distance for rect_length pixels, across it covers
+        #cross for rect_width pixels (same truncation as pygame.Rect)
+        self.lane_origin = np.asarray(lane_origin, dtype=np.float64)
+        self.lane_direction = np.asarray(lane_direction, dtype=np.float64)
+        self.lane_cross = np.trunc(np.asarray(lane_cross, dtype=np.float64)).astype(np.int64)
+        self.rect_length = int(car_length)
+        self.rect_width = int(car_width)
+
+        shape = (num_sims, len(LANE_NAMES), capacity)
+        self.distance = np.zeros(shape)
+        self.speed = np.zeros(shape)
+        self.crashed = np.zeros(shape, dtype=bool)
+        self.wait = np.zeros(shape)
+        self.count = np.zeros(shape[:2], dtype=np.int64)
+
+    @classmethod
+    def from_sim(cls, sim, num_sims, capacity=64):
+        """Build arrays with the car and screen constants of a TrafficSim."""
+        stop_pos = [sim.stop_posD if lane in ["du", "rl"] else sim.stop_posU for lane in LANE_NAMES]
+        return cls(num_sims, sim.car_length, sim.car_width, sim.car_spacing, sim.speed_limit_px - 10,
+                   sim.max_car_accel, sim.max_car_decel + 10, stop_pos,
+                   sim.lane_origin, sim.lane_direction, sim.lane_cross, capacity)
+
+    @property
+    def capacity(self):
+        return self.distance.shape[2]
+
+    def clear(self, sim=None):
+        if sim is None:
+            self.count[:] = 0
+            self.crashed[:] = False
+            self.wait[:] = 0.0
+        else:
+            self.count[sim] = 0
+            self.crashed[sim] = False
+            self.wait[sim] = 0.0
+
+    def _grow(self, capacity):
+        extra = capacity - self.capacity
+        pad = ((0, 0), (0, 0), (0, extra))
+        self.distance = np.pad(self.distance, pad)
+        self.speed = np.pad(self.speed, pad)
+        self.crashed = np.pad(self.crashed, pad)
+        self.wait = np.pad(self.wait, pad)
+
+    def spawn(self, sim, lane, distance):
+        n = self.count[sim, lane]
+        if n >= self.capacity:
+            self._grow(self.capacity * 2)
+        self.distance[sim, lane, n] = distance
+        self.speed[sim, lane, n] = self.max_speed
+        self.crashed[sim, lane, n] = False
+        self.wait[sim, lane, n] = 0.0
+        self.count[sim, lane] = n + 1
+
+    def spawn_many(self, sims, lanes, distances):
+        # at most one new car per (sim, lane) per call
+        n = self.count[sims, lanes]
+        if n.size and n.max() >= self.capacity:
+            self._grow(max(self.capacity * 2, int(n.max()) + 1))
+        self.distance[sims, lanes, n] = distances
+        self.speed[sims, lanes, n] = self.max_speed
+        self.crashed[sims, lanes, n] = False
+        self.wait[sims, lanes, n] = 0.0
+        self.count[sims, lanes] = n + 1
+
+    def valid(self):
+        return np.arange(self.capacity) < self.count[..., None]
+
+    def _sort_lanes(self, valid):
+        # cars can only swap places by running into each other, so this is rare
+        unsorted = (self.distance[..., 1:] > self.distance[..., :-1]) & valid[..., 1:]
+        s, lane = np.nonzero(unsorted.any(axis=-1))
+        if not s.size:
+            return
+        key = np.where(valid[s, lane], -self.distance[s, lane], np.inf)
+        order = np.argsort(key, axis=-1, kind="stable")
+        rows = (s[:, None], lane[:, None], order)
+        self.distance[s, lane] = self.distance[rows]
+        self.speed[s, lane] = self.speed[rows]
+        self.crashed[s, lane] = self.crashed[rows]
+        self.wait[s, lane] = self.wait[rows]
+
+    def _compact(self, keep):
+        # stable move of kept cars to the front of each lane, only touching
+        # the lanes that lost a car
+        valid = self.valid()
+        s, lane = np.nonzero((valid & ~keep).any(axis=-1))
+        order = np.argsort(~keep[s, lane], axis=-1, kind="stable")
+        rows = (s[:, None], lane[:, None], order)
+        self.distance[s, lane] = self.distance[rows]
+        self.speed[s, lane] = self.speed[rows]
+        self.crashed[s, lane] = self.crashed[rows]
+        self.wait[s, lane] = self.wait[rows]
+        self.count[s, lane] = keep[s, lane].sum(axis=-1)
+
+    def _target(self, d, v, target, lead_d, lead_v, slow):
+        #match the speed of the car ahead. front cars get a leader at +inf,
+        #which leaves their target untouched
+        gap = (lead_d - self.car_length) - d
+        desired_gap = 0.6 * v + self.car_spacing
+        closing = np.minimum(self.max_speed, lead_v + 1.8 * (gap - desired_gap))
+        target = np.minimum(target, np.where(gap <= desired_gap + 2.0, lead_v, closing))
+
+        #if too close to car ahead, slow down
+        target = np.where(lead_d - d < (self.car_length + self.car_spacing), 0.0, target)
+
+        #if the lights yellow, go slow.
+        quarter = self.max_speed / 4
+        return np.where(slow & (target > quarter), quarter, target)
+
+    def _move(self, d, v, target, dt):
+        # accelerate or decelerate
+        new_v = np.where(
+            v < target,
+            np.minimum(np.minimum(v + self.accel * dt, target), self.max_speed),
+            np.maximum(np.maximum(v - self.decel * dt, target), 0.0),
+        )
+        new_v[new_v < 1e-3] = 0.0
+        return d + new_v * dt, new_v
+
+    def _step(self, d, v, target, lead_d, lead_v, slow, active, dt):
+        new_d, new_v = self._move(d, v, self._target(d, v, target, lead_d, lead_v, slow), dt)
+        return np.where(active, new_d, d), np.where(active, new_v, v)
+
+    def _sweep(self, first, d, v, target, slow, active, new_d, new_v, dt):
+        """
+        Same maths as _step, one slot at a time from first to the end, each
+        slot against the finished slot in front of it. Everything that doesn't
+        depend on the leader is worked out up front and the slots are laid out
+        contiguously, so each slot is a handful of in-place ufunc calls.
+        """
+        def slots(a):
+            return np.ascontiguousarray(np.moveaxis(a[..., first - 1:], -1, 0).reshape(a.shape[-1] - first + 1, -1))
+
+        d, v, target, slow, active = slots(d), slots(v), slots(target), slots(slow), slots(active)
+        desired_gap = 0.6 * v + self.car_spacing
+        near = desired_gap + 2.0
+        #min/max chains reordered, the results are bit for bit the same as _move
+        up = np.minimum(v + self.accel * dt, self.max_speed)
+        down = np.maximum(v - self.decel * dt, 0.0)
+        inactive = ~active
+        quarter = self.max_speed / 4
+        too_close = self.car_length + self.car_spacing
+
+        out_d = slots(new_d)
+        out_v = slots(new_v)
+        t = np.empty(d.shape[1])
+        tmp = np.empty_like(t)
+        mask = np.empty(d.shape[1], dtype=bool)
+        for i in range(1, d.shape[0]):
+            lead_d, lead_v = out_d[i - 1], out_v[i - 1]
+            gap = np.subtract(lead_d, self.car_length, out=tmp)
+            gap -= d[i]
+            np.subtract(gap, desired_gap[i], out=t)
+            t *= 1.8
+            t += lead_v
+            np.minimum(t, self.max_speed, out=t)
+            np.copyto(t, lead_v, where=np.less_equal(gap, near[i], out=mask))
+            np.minimum(target[i], t, out=t)
+            np.copyto(t, 0.0, where=np.less(np.subtract(lead_d, d[i], out=tmp), too_close, out=mask))
+            np.greater(t, quarter, out=mask)
+            mask &= slow[i]
+            np.copyto(t, quarter, where=mask)
+
+            speed = out_v[i]
+            np.maximum(down[i], t, out=speed)
+            np.copyto(speed, np.minimum(up[i], t, out=tmp), where=np.less(v[i], t, out=mask))
+            np.copyto(speed, 0.0, where=np.less(speed, 1e-3, out=mask))
+            np.copyto(speed, v[i], where=inactive[i])
+            np.multiply(speed, dt, out=out_d[i])
+            out_d[i] += d[i]
+            np.copyto(out_d[i], d[i], where=inactive[i])
+
+        shape = new_d[..., first - 1:].shape
+        new_d[..., first:] = np.moveaxis(out_d.reshape(shape[-1:] + shape[:-1]), 0, -1)[..., 1:]
+        new_v[..., first:] = np.moveaxis(out_v.reshape(shape[-1:] + shape[:-1]), 0, -1)[..., 1:]
+
+    def update(self, dt, lights, passes=3):
+        """
+        Advance every car by dt. lights is an int array of light codes shaped
+        (num_sims, 4). Returns the wait time added in each sim, shape (num_sims,).
+        """
+        self._sort_lanes(self.valid())
+        # only the slots that hold a car in at least one lane
+        m = int(self.count.max())
+        valid = np.arange(m) < self.count[..., None]
+        active = valid & ~self.crashed[..., :m]
+
+        d = self.distance[..., :m]
+        v = self.speed[..., :m]
+        stop = self.stop_pos[None, :, None]
+        lights = np.asarray(lights)[..., None]
+
+        #update the wait time
+        waiting = active & (d < stop) & (v < self.max_speed)
+        self.wait[..., :m] += waiting * dt
+        wait_added = waiting.sum(axis=(1, 2)) * dt
+
+        #if the lights red, stop
+        distance_to_stop = stop - d
+        stopping = (v * v) / (2.0 * self.decel) if self.decel > 0 else np.full_like(v, np.inf)
+        red_stop = (lights == RED) & (distance_to_stop > 0) & (distance_to_stop <= stopping + 5.0)
+        target = np.where(red_stop, 0.0, self.max_speed)
+        slow = (lights == YELLOW) & (d < stop)
+
+        # the car ahead of slot i is slot i-1, slot 0 has nothing ahead
+        lead_d = np.full_like(d, np.inf)
+        lead_v = np.full_like(v, self.max_speed)
+
+        # whole-array passes against the newest leaders. once a pass changes
+        # nothing every car matches the one-by-one update
+        new_d, new_v = d, v
+        for _ in range(passes):
+            lead_d[..., 1:] = new_d[..., :-1]
+            lead_v[..., 1:] = new_v[..., :-1]
+            next_d, next_v = self._step(d, v, target, lead_d, lead_v, slow, active, dt)
+            changed = (next_d != new_d) | (next_v != new_v)
+            new_d, new_v = next_d, next_v
+            if not changed.any():
+                break
+        else:
+            # long platoons still moving, finish them slot by slot. every slot
+            # in front of the first one that changed has already settled
+            first = max(int(np.argmax(changed.any(axis=(0, 1)))), 1)
+            self._sweep(first, d, v, target, slow, active, new_d, new_v, dt)
+
+        self.distance[..., :m] = new_d
+        self.speed[..., :m] = new_v
+        return wait_added
+
+    def remove_passed(self, limit):
+        """Drop cars past limit and return how many left each sim, shape (num_sims,)."""
+        valid = self.valid()
+        passed = valid & (self.distance > limit)
+        total = passed.sum(axis=(1, 2))
+        if total.any():
+            self._compact(valid & ~passed)
+        return total
+
+    def remove_crashed(self):
+        valid = self.valid()
+        crashed = valid & self.crashed
+        if crashed.any():
+            self._compact(valid & ~crashed)
+            self.crashed[:] = False
+
+    @staticmethod
+    def _ranked(hits):
+        #slot numbers of the hits in each sim, packed to the left, -1 padded
+        rank = np.cumsum(hits, axis=-1) - 1
+        k = int(rank[:, -1].max()) + 1 if hits.size else 0
+        out = np.full((hits.shape[0], max(k, 0)), -1, dtype=np.int64)
+        s, slot = np.nonzero(hits)
+        out[s, rank[s, slot]] = slot
+        return out
+
+    def crash_pairs(self):
+        """
+        Overlapping cars on screen, as arrays (sim, a, b) sorted the way
+        checkForCrashes walks them. a and b are lane*capacity + slot, a < b.
+
+        Opposite lanes never share pixels, so two lanes can only collide
+        inside the box where their roads cross, and a horizontal and a vertical
+        car overlap exactly when each covers the other's lane band. Cars in the
+        same lane are checked against the cars next to them.
+        """
+        cap = self.capacity
+        m = int(self.count.max())
+        d = self.distance[..., :m]
+        live = (np.arange(m) < self.count[..., None]) & ~self.crashed[..., :m] & (d > 0)
+        pos = np.trunc(self.lane_origin[None, :, None] + self.lane_direction[None, :, None] * d).astype(np.int64)
+
+        sims, first, second = [], [], []
+
+        #cover[s, k, c, slot]: car in lane k reaches into the band of lane c
+        band = self.lane_cross[None, None, :, None]
+        p = pos[:, :, None, :]
+        cover = live[:, :, None, :] & (p < band + self.rect_width) & (p + self.rect_length > band)
+        crossing = cover[:, :2, 2:].any(axis=-1) & cover[:, 2:, :2].any(axis=-1).transpose(0, 2, 1)
+        for h, v in zip(*np.nonzero(crossing.any(axis=0))):
+            v += 2
+            hs = self._ranked(cover[:, h, v])
+            vs = self._ranked(cover[:, v, h])
+            for i in range(hs.shape[1]):
+                for j in range(vs.shape[1]):
+                    s = np.flatnonzero((hs[:, i] >= 0) & (vs[:, j] >= 0))
+                    sims.append(s)
+                    first.append(h * cap + hs[s, i])
+                    second.append(v * cap + vs[s, j])
+
+        for offset in range(1, m):
+            both = live[..., :-offset] & live[..., offset:]
+            hit = both & (np.abs(pos[..., :-offset] - pos[..., offset:]) < self.rect_length)
+            if not hit.any():
+                break
+            s, lane, slot = np.nonzero(hit)
+            sims.append(s)
+            first.append(lane * cap + slot)
+            second.append(lane * cap + slot + offset)
+
+        if not sims:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        sims = np.concatenate(sims)
+        first = np.concatenate(first)
+        second = np.concatenate(second)
+        order = np.lexsort((second, first, sims))
+        return sims[order], first[order], second[order]
+
+    def apply_crashes(self, sims, first, second):
+        """
+        Mark the crashed cars the way checkForCrashes does: a pair counts as a
+        crash unless both cars already crashed this tick. Returns the new
+        crashes per sim and the crashed cars in order as (sim, lane, slot).
+        """
+        crashes = np.zeros(self.num_sims, dtype=np.int64)
+        cars = []
+        if not len(sims):
+            return crashes, cars
+        cap = self.capacity
+        flat = self.crashed.reshape(self.num_sims, -1)
+        for s, a, b in zip(sims.tolist(), first.tolist(), second.tolist()):
+            if not flat[s, a] or not flat[s, b]:
+                flat[s, a] = flat[s, b] = True
+                crashes[s] += 1
+                cars.append((s, a // cap, a % cap))
+                cars.append((s, b // cap, b % cap))
+        return crashes, cars
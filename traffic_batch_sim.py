@@ -0,0 +1,205 @@
+import numpy as np
+import traffic_sim
+from traffic_sim import ARRIVAL_BLOCK, arrival_schedule
+from traffic_arrays import CarArrays, LANE_NAMES, GREEN, YELLOW, RED, STATS_DTYPE
+from traffic_env import DURATIONS
+
+# horizontal and vertical light for each phase, same cycle as TrafficEnv._change_lights
+PHASE_HORIZ = np.array([GREEN, YELLOW, RED, YELLOW])
+PHASE_VERT = np.array([RED, YELLOW, GREEN, YELLOW])
+
+
+class BatchedTrafficSim:
+    """
+    Many independent intersections stepped together with one call.
+
+    Uses the same rules as TrafficSim(engine="numpy"). All car state lives
+    in one CarArrays and every per-intersection counter is an array with one
+    entry per sim. Every sim has its own arrival stream, sim i seeded with
+    seed + i (or seed[i] for a list) runs the same episodes as
+    TrafficSim(s, r, seed=seed + i).
+    """
+
+    def __init__(self, num_sims, s, r, seed=None):
+        # 1 - normal
+        # 2 - rush hour
+        # 3 - big event
+        if s not in (1, 2, 3):
+            raise ValueError(f"unknown scenario: {s}")
+        if r != 'normal':
+            raise ValueError(f"unknown reward function: {r}")
+        self.num_sims = num_sims
+        self.scenario = s
+        self.reward_function = r
+
+        #constants come from a regular sim so the two can never drift apart
+        template = traffic_sim.TrafficSim(s, r)
+        self.car_length = template.car_length
+        self.car_spacing = template.car_spacing
+        self.screen_height = template.screen_height
+        self.trial_time = template.trial_time
+        self.cars = CarArrays.from_sim(template, num_sims)
+        self.seed(seed)
+
+        #lr and ud cars start one car length further back
+        self.spawn_offset = np.array([self.car_length if lane in ["lr", "ud"] else 0 for lane in LANE_NAMES])
+
+        self.horiz_light = np.full(num_sims, RED, dtype=np.int64)
+        self.vert_light = np.full(num_sims, RED, dtype=np.int64)
+
+        self.total_wait_time = np.zeros(num_sims)
+        self.num_cars = np.zeros(num_sims, dtype=np.int64)
+        self.num_crashes = np.zeros(num_sims, dtype=np.int64)
+        self.cars_passed = np.zeros(num_sims, dtype=np.int64)
+        self.total_time = np.zeros(num_sims)
+
+        #one STATS_DTYPE record per sim, rewritten by every step_sim
+        self.stats = np.zeros(num_sims, dtype=STATS_DTYPE)
+
+    def reset_vals(self, sims=None):
+        #sims is an index array, None resets everything
+        if sims is None:
+            sims = np.arange(self.num_sims)
+        for sim in np.asarray(sims).tolist():
+            self.cars.clear(sim)
+        #every episode starts on a fresh block of arrivals, like TrafficSim.reset_vals
+        self.arrival_tick[sims] = ARRIVAL_BLOCK
+        self.horiz_light[sims] = RED
+        self.vert_light[sims] = RED
+        self.total_wait_time[sims] = 0.0
+        self.num_cars[sims] = 0
+        self.num_crashes[sims] = 0
+        self.cars_passed[sims] = 0
+        self.total_time[sims] = 0.0
+
+    def set_lights(self, sims, horiz, vert):
+        self.horiz_light[sims] = horiz
+        self.vert_light[sims] = vert
+
+    def lights(self):
+        #light code for each lane, shape (num_sims, 4)
+        return np.stack([self.horiz_light, self.horiz_light, self.vert_light, self.vert_light], axis=1)
+
+    def cars_per_lane(self):
+        return self.cars.count
+
+    def _spawn(self, sims, lanes):
+        if not sims.size:
+            return
+        n = self.cars.count[sims, lanes]
+        distance = n*(self.car_length + self.car_spacing) * -1 - self.spawn_offset[lanes] - 300
+        self.cars.spawn_many(sims, lanes, distance)
+        np.add.at(self.num_cars, sims, 1)
+
+    def seed(self, seed=None):
+        #an int seeds sim i with seed + i, a list gives every sim its own seed
+        if seed is None or np.isscalar(seed):
+            seed = [None if seed is None else seed + i for i in range(self.num_sims)]
+        self.rngs = [np.random.default_rng(sd) for sd in seed]
+        self.arrivals = np.full((self.num_sims, ARRIVAL_BLOCK, 2), -1, dtype=np.int64)
+        self.arrival_tick = np.full(self.num_sims, ARRIVAL_BLOCK, dtype=np.int64)
+
+    def createCars(self):
+        for sim in np.flatnonzero(self.arrival_tick >= ARRIVAL_BLOCK).tolist():
+            self.arrivals[sim] = arrival_schedule(self.rngs[sim], self.scenario, ARRIVAL_BLOCK)
+            self.arrival_tick[sim] = 0
+
+        lanes = self.arrivals[np.arange(self.num_sims), self.arrival_tick]
+        self.arrival_tick += 1
+        #same order as TrafficSim.createCar, the second column is scenario 3's rl stream
+        for col in range(lanes.shape[1]):
+            sims = np.flatnonzero(lanes[:, col] >= 0)
+            self._spawn(sims, lanes[sims, col])
+
+    def step_sim(self, dt):
+        """
+        Advance every intersection by dt. Returns the reward per sim and
+        self.stats, a STATS_DTYPE array with the same fields as
+        TrafficSim.step_sim's info. It is overwritten by the next step.
+        """
+        prev_wait_time = self.total_wait_time.copy()
+        prev_passed = self.cars_passed.copy()
+
+        self.createCars()
+
+        self.total_wait_time += self.cars.update(dt, self.lights())
+        self.cars_passed += self.cars.remove_passed(self.screen_height + self.car_length)
+
+        new_crashes, _ = self.cars.apply_crashes(*self.cars.crash_pairs())
+        self.num_crashes += new_crashes
+        self.cars.remove_crashed()
+
+        wait_diff = self.total_wait_time - prev_wait_time
+        passed_diff = self.cars_passed - prev_passed
+        waiting_rew = -2 * wait_diff
+        passed_rew = passed_diff * 50
+        reward = waiting_rew + passed_rew
+
+        stats = self.stats
+        stats["vert_light"] = self.vert_light
+        stats["horiz_light"] = self.horiz_light
+        stats["total_wait_time"] = self.total_wait_time
+        np.divide(self.total_wait_time, self.num_cars, out=stats["average_wait_time"], where=self.num_cars > 0)
+        stats["average_wait_time"][self.num_cars == 0] = 0.0
+        stats["wait_diff"] = wait_diff
+        stats["num_crashes"] = self.num_crashes
+        stats["new_crashes"] = new_crashes
+        stats["cars_passed"] = self.cars_passed
+        stats["cars_per_lane"] = self.cars.count
+        stats["waiting_rew"] = waiting_rew
+        stats["passed_rew"] = passed_rew
+        self.total_time += dt
+
+        return reward, stats
+
+
+class BatchedTrafficEnv:
+    """
+    The TrafficEnv rules (phase cycle, durations, observation) for every
+    sim of a BatchedTrafficSim. No gym or SB3 in here so scripts that only
+    play a NumpyPolicy import it quickly, TrafficVecEnv puts the VecEnv
+    interface on top.
+    """
+
+    def __init__(self, num_envs, s, r, seed=None, dt=1/20):
+        self.num_envs = num_envs
+        self.sim = BatchedTrafficSim(num_envs, s, r, seed=seed)
+        self.durations = np.array(DURATIONS)
+        self.dt = dt
+        self.current_phase = np.zeros(num_envs, dtype=np.int64)
+        self.time_remaining = np.zeros(num_envs)
+        self.stats = {}
+        #BatchedTrafficSim isn't timed by stage, so traffic_timers.collect() finds nothing here
+        self.timers = None
+
+    def _get_observation(self):
+        obs = np.empty((self.num_envs, 6), dtype=np.float32)
+        obs[:, 0] = self.current_phase
+        obs[:, 1] = self.time_remaining
+        obs[:, 2:] = np.minimum(self.sim.cars_per_lane(), 300)
+        return obs
+
+    def _reset_envs(self, envs):
+        self.sim.reset_vals(envs)
+        self.current_phase[envs] = 0
+        self.time_remaining[envs] = 0.0
+
+    def reset_all(self):
+        self._reset_envs(np.arange(self.num_envs))
+        return self._get_observation()
+
+    def advance(self, actions):
+        """
+        One tick of every env. Returns the observations, rewards and which
+        envs reached trial_time, finished envs are not reset.
+        """
+        #pick a new phase wherever the last one ran out
+        change = self.time_remaining <= 0
+        self.time_remaining[change] = self.durations[actions[change]]
+        self.current_phase[change] = (self.current_phase[change] + 1) % 4
+        self.sim.set_lights(change, PHASE_HORIZ[self.current_phase[change]], PHASE_VERT[self.current_phase[change]])
+
+        reward, self.stats = self.sim.step_sim(self.dt)
+        self.time_remaining = np.maximum(self.time_remaining - self.dt, 0.0)
+        dones = self.sim.total_time >= self.sim.trial_time
+        return self._get_observation(), reward, dones
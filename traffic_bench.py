@@ -0,0 +1,260 @@
+"""
+to run:
+python traffic_bench.py run --out bench.json
+python traffic_bench.py compare old.json new.json
+
+run times the hot paths and writes one JSON file. compare lines two of
+them up and exits with 1 if anything got slower than the threshold, so it
+can gate changes to step_sim, checkForCrashes, the vec envs, fast forward
+or drawing.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+
+# (number of envs, steps) for the vec env benchmarks
+VEC_ENVS = 4
+VEC_STEPS = 2000
+
+
+def best_time(fn, repeat):
+    #best of repeat runs, the least disturbed by whatever else the machine is doing
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def queued_sim(s, per_lane, engine="objects", seed=0):
+    """
+    A sim with per_lane cars queued behind each stop line (lights red), so
+    step_sim and checkForCrashes start from a known number of cars. The
+    scenario's arrivals keep joining the queues on top.
+    """
+    from traffic_sim import TrafficSim
+    sim = TrafficSim(s, 'normal', seed=seed, engine=engine)
+    sim.reset_vals()
+    for _ in range(per_lane):
+        for lane in ("lr", "rl", "ud", "du"):
+            sim.add_car(lane)
+    #let the queues roll up to the stop lines
+    for _ in range(400):
+        sim.step_sim(1/20, False, info=False)
+    return sim
+
+
+def bench_step_sim(results, repeat, ticks=200):
+    #ticks/s of step_sim, restarting from the same queue every run so its length stays put
+    for engine in ("objects", "numpy"):
+        for s in (1, 2, 3):
+            for per_lane in (0, 5, 15):
+                sim = queued_sim(s, per_lane, engine)
+                state = sim.snapshot()
+
+                def run():
+                    sim.restore(state)
+                    for _ in range(ticks):
+                        sim.step_sim(1/20, False, info=False)
+                seconds = best_time(run, repeat)
+                results[f"step_sim/{engine}/s{s}/queue{per_lane}"] = {
+                    "value": ticks / seconds, "unit": "ticks/s", "higher_is_better": True}
+
+
+def bench_crashes(results, repeat, calls=500):
+    #a queue with nothing in the box never crashes, so the same state can be checked over and over
+    for per_lane in (1, 5, 10, 20, 40):
+        sim = queued_sim(1, per_lane)
+
+        def run():
+            for _ in range(calls):
+                sim.checkForCrashes()
+        seconds = best_time(run, repeat)
+        results[f"checkForCrashes/cars{4 * per_lane}"] = {
+            "value": seconds / calls * 1e6, "unit": "us/call", "higher_is_better": False}
+
+
+def make_env(i):
+    def _init():
+        from traffic_env import TrafficEnv
+        return TrafficEnv(1, 'normal', seed=i, info="none")
+    return _init
+
+
+def bench_vec_envs(results, repeat, steps=VEC_STEPS):
+    from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
+    from traffic_shared_vec_env import SharedMemVecEnv
+    from traffic_vec_env import TrafficVecEnv
+
+    makers = {
+        "DummyVecEnv": lambda: DummyVecEnv([make_env(i) for i in range(VEC_ENVS)]),
+        "SubprocVecEnv": lambda: SubprocVecEnv([make_env(i) for i in range(VEC_ENVS)]),
+        "SharedMemVecEnv": lambda: SharedMemVecEnv([make_env(i) for i in range(VEC_ENVS)]),
+        "TrafficVecEnv": lambda: TrafficVecEnv(VEC_ENVS, 1, 'normal', seed=0),
+    }
+    rng = np.random.default_rng(0)
+    actions = rng.integers(11, size=(steps, VEC_ENVS))
+    for name, make in makers.items():
+        env = make()
+        env.reset()
+
+        def run():
+            for action in actions:
+                env.step(action)
+        seconds = best_time(run, repeat)
+        env.close()
+        results[f"vec_env/{name}/{VEC_ENVS}envs"] = {
+            "value": steps * VEC_ENVS / seconds, "unit": "env steps/s", "higher_is_better": True}
+
+
+def bench_fast_forward(results, repeat, episodes=5):
+    #whole macro episodes with the same actions, ticking every tick vs skipping the quiet ones
+    from traffic_env import TrafficEnv
+    rng = np.random.default_rng(0)
+    actions = rng.integers(11, size=1000)
+    for engine in ("objects", "numpy"):
+        for s in (1, 2, 3):
+            for fast_forward in (False, True):
+                env = TrafficEnv(s, 'normal', engine=engine, macro=True, info="none", fast_forward=fast_forward)
+
+                def run():
+                    for episode in range(episodes):
+                        env.reset(seed=episode)
+                        for action in actions:
+                            _, _, terminated, truncated, _ = env.step(action)
+                            if terminated or truncated:
+                                break
+                seconds = best_time(run, repeat)
+                mode = "fast_forward" if fast_forward else "ticking"
+                results[f"macro_episode/{engine}/s{s}/{mode}"] = {
+                    "value": episodes / seconds, "unit": "episodes/s", "higher_is_better": True}
+
+
+def bench_draw(results, repeat, frames=200):
+    #frame time of draw_screen alone, offscreen so it runs without a display
+    from traffic_env import TrafficEnv
+    env = TrafficEnv(3, 'normal', seed=0, info="none")
+    env.reset()
+    env.sim.init_pygame(offscreen=True)
+    for _ in range(300):
+        env.step(4)
+    state = env.snapshot()
+
+    #the first frame builds the cached background
+    env.sim.draw_screen()
+
+    def run():
+        env.restore(state)
+        for _ in range(frames):
+            env.step(4)
+            env.sim.draw_screen()
+    total = best_time(run, repeat)
+
+    #take the stepping back out so only the drawing is left
+    def step_only():
+        env.restore(state)
+        for _ in range(frames):
+            env.step(4)
+    stepping = best_time(step_only, repeat)
+    results["draw_screen/frame"] = {
+        "value": max(total - stepping, 0.0) / frames * 1e3, "unit": "ms/frame", "higher_is_better": False}
+
+
+BENCHMARKS = {
+    "step_sim": bench_step_sim,
+    "crashes": bench_crashes,
+    "vec_env": bench_vec_envs,
+    "fast_forward": bench_fast_forward,
+    "draw": bench_draw,
+}
+
+
+def machine():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run(names, repeat):
+    results = {}
+    for name in names:
+        start = time.time()
+        BENCHMARKS[name](results, repeat)
+        print(f"{name} took {time.time() - start:.1f} seconds", file=sys.stderr)
+    return {"machine": machine(), "results": results}
+
+
+def _ratio(x, y):
+    #x / y where a zero y (a timing clamped to 0) is infinitely better, or no change when x is 0 too
+    if y == 0:
+        return 1.0 if x == 0 else float("inf")
+    return x / y
+
+
+def compare(old, new, threshold):
+    """
+    Rows of (name, old value, new value, change, unit) where change is how much
+    better new is as a fraction, negative is slower. Returns the rows and
+    the names that got worse by more than threshold.
+    """
+    rows = []
+    regressions = []
+    for name in sorted(set(old["results"]) & set(new["results"])):
+        a, b = old["results"][name], new["results"][name]
+        if b["higher_is_better"]:
+            change = _ratio(b["value"], a["value"]) - 1
+        else:
+            change = _ratio(a["value"], b["value"]) - 1
+        rows.append((name, a["value"], b["value"], change, b["unit"]))
+        if change < -threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the simulator, env and renderer")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run")
+    run_parser.add_argument("--out", default="bench.json")
+    run_parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    run_parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark, the best one counts")
+    compare_parser = sub.add_parser("compare")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        report = run(args.only, args.repeat)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=1)
+        for name, row in report["results"].items():
+            print(f"{name:<40} {row['value']:>12.2f} {row['unit']}")
+    else:
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        rows, regressions = compare(old, new, args.threshold)
+        for name, a, b, change, unit in rows:
+            flag = "  REGRESSION" if name in regressions else ""
+            print(f"{name:<40} {a:>12.2f} -> {b:>12.2f} {unit:<12} {change:+7.1%}{flag}")
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        sys.exit(1 if regressions else 0)
@@ -1,16 +1,61 @@
 import gymnasium as gym
 from gymnasium import spaces
 import numpy as np
-import pygame
 import traffic_sim
+from traffic_timers import StageTimers
+
+# seconds a light phase can be held for, one per action
+DURATIONS = [1.0, 2.0, 4.0, 6.0, 8.0, 10.0, 12.0, 14.0, 16.0, 18.0, 20.0]
+
+# what step() puts in info:
+# "full" - the sim's info dict every step, plus "ticks"
+# "episode" - empty until the last step, which gets {"stats": STATS_DTYPE record}
+# "none" - always empty, Monitor still adds its "episode" entry
+INFO_MODES = ("none", "episode", "full")
+
+
+def observation_space():
+    # Observation: [current light state, time remaining, number of cars in each lane (4)]
+    # shared by every env that takes TrafficEnv's observations
+    return spaces.Box(
+        low=np.array([0, 0, 0, 0, 0, 0], dtype=np.float32),
+        high=np.array([3, int(max(DURATIONS)), 300, 300, 300, 300], dtype=np.float32),
+        dtype=np.float32
+    )
 
 class TrafficEnv(gym.Env):
-    metadata = {"render_modes": ["human"]}
+    metadata = {"render_modes": ["human", "rgb_array", "rgb_array_list"], "render_fps": 20}
 
-    def __init__(self, s, r, seed=None):
+    def __init__(self, s, r, seed=None, engine="objects", macro=False, info="full",
+                 render_mode=None, render_size=None, render_every=1, recorder=None, timers=False,
+                 fast_forward=False):
         super(TrafficEnv, self).__init__()
 
-        self.sim = traffic_sim.TrafficSim(s, r, seed=seed)
+        if info not in INFO_MODES:
+            raise ValueError(f"unknown info mode: {info}")
+        self.info_mode = info
+
+        # "human" - draw every tick to a window
+        # "rgb_array" - render() draws the current state offscreen and returns it
+        # "rgb_array_list" - every render_every'th tick is drawn offscreen while
+        #                    stepping, render() returns the frames since the last call
+        # render_size=(width, height) scales the frames, default 900x900
+        if render_mode is not None and render_mode not in self.metadata["render_modes"]:
+            raise ValueError(f"unknown render mode: {render_mode}")
+        self.render_mode = render_mode
+        self.render_size = render_size
+        self.render_every = render_every
+        self.frames = []
+        self.ticks = 0
+        self.last_ticks = 0
+
+        self.sim = traffic_sim.TrafficSim(s, r, seed=seed, engine=engine)
+        # recorder=TrajectoryRecorder(path) writes every tick to disk
+        self.sim.recorder = recorder
+        # timers=True times every stage of step_sim, read with env.timers
+        # or traffic_timers.collect(vec_env)
+        if timers:
+            self.sim.timers = StageTimers()
 
         """
         3 possible light combinations:
@@ -19,17 +64,10 @@ class TrafficEnv(gym.Env):
         2 = both yellow
         """
 
-        self.durations = [1.0, 2.0, 4.0, 6.0, 8.0, 10.0, 12.0, 14.0, 16.0, 18.0, 20.0]
+        self.durations = list(DURATIONS)
         self.action_space = spaces.Discrete(len(self.durations))
 
-        # Observation: [current light state, time remaining, number of cars in each lane (4)]
-        self.observation_space = spaces.Box(
-            low=np.array([0, 0, 0, 0, 0, 0], dtype=np.float32),
-            high=np.array([3, int(max(self.durations)), 300, 300, 300, 300], dtype=np.float32),
-            dtype=np.float32
-        )
-
-        self.render = False
+        self.observation_space = observation_space()
 
         self.dt = 1/20
 
@@ -37,10 +75,20 @@ class TrafficEnv(gym.Env):
         
         self.time_remaining = 0.0
 
+        # macro=True: one step is one decision, the whole chosen phase is
+        # simulated inside step and the tick rewards are summed
+        self.macro = macro
+
+        # fast_forward=True (macro only): stretches of a phase where cars only
+        # cruise or sit in a queue are jumped over with TrafficSim.skip_ticks,
+        # same results as ticking through them
+        self.fast_forward = fast_forward
+        self.quiet_backoff = 0
+        self.quiet_wait = 1
 
     # Helper functions
     def _get_observation(self):
-        num_cars = [min(len(lane), 300) for lane in self.sim.lanes]
+        num_cars = [min(n, 300) for n in self.sim.cars_per_lane()]
 
         return np.array([self.current_phase, self.time_remaining] + num_cars, dtype=np.float32)
 
@@ -65,25 +113,115 @@ class TrafficEnv(gym.Env):
             self._change_lights()
 
         reward = 0.0
+        ticks = 0
+        skip = self.macro and self.fast_forward and self.render_mode is None
+        if skip:
+            left = self._ticks_left()
+
+        while True:
+            if skip and self.quiet_backoff <= 0:
+                quiet, cruise = self.sim.quiet_ticks(self.dt, left - 1)
+                if quiet > 1:
+                    for r in self.sim.skip_ticks(self.dt, quiet, cruise):
+                        reward += r
+                    ticks += quiet
+                    self.ticks += quiet
+                    left -= quiet
+                    for _ in range(quiet):
+                        self.time_remaining = max(self.time_remaining - self.dt, 0.0)
+                    self.sim.time_remaining = self.time_remaining
+                if quiet >= 4:
+                    self.quiet_wait = 1
+                else:
+                    #busy, look for a quiet stretch again after 8, 16, ... 128 ticks
+                    self.quiet_wait = min(max(self.quiet_wait * 2, 8), 128)
+                    self.quiet_backoff = self.quiet_wait
+            self.quiet_backoff -= 1
+            self.sim.time_remaining = self.time_remaining
+            self.sim.action = action
+            r, info = self.sim.step_sim(self.dt, self.render_mode == "human", info=self.info_mode == "full")
+            reward += r
+            ticks += 1
+            self.ticks += 1
+            if self.render_mode == "rgb_array_list" and self.ticks % self.render_every == 0:
+                self.frames.append(self._frame())
+            self.time_remaining = max(self.time_remaining - self.dt, 0.0)
+            if skip:
+                left -= 1
+            terminated = False #self.sim.num_crashes > 0***********************************************************************
+            truncated = self.sim.total_time >= self.sim.trial_time
+            if not self.macro or self.time_remaining <= 0 or terminated or truncated:
+                break
 
-        #while self.time_remaining > 0 and self.sim.num_crashes == 0 and self.sim.total_time < self.sim.trial_time:
-        self.sim.time_remaining = self.time_remaining
-        r, info = self.sim.step_sim(self.dt, self.render)
-        reward += r
-        self.time_remaining = max(self.time_remaining - self.dt, 0.0)
         obs = self._get_observation()
-        terminated = False #self.sim.num_crashes > 0***********************************************************************
-        truncated = self.sim.total_time >= self.sim.trial_time
+        if self.info_mode != "full":
+            info = {"stats": self.sim.stats()} if self.info_mode == "episode" and (terminated or truncated) else {}
+        # ticks this step ran, more than 1 in macro mode
+        self.last_ticks = ticks
+        if self.info_mode == "full":
+            info["ticks"] = ticks
 
         if terminated:
             reward = -10000 # heavy crash penalty
         
         return obs, reward, terminated, truncated, info
 
+    def _ticks_left(self):
+        #ticks until the phase runs out or the episode ends, whichever is first,
+        #counted the same way step() and step_sim count them
+        ticks = 0
+        remaining = self.time_remaining
+        total_time = self.sim.total_time
+        while True:
+            ticks += 1
+            remaining = max(remaining - self.dt, 0.0)
+            total_time += self.dt
+            if remaining <= 0 or total_time >= self.sim.trial_time:
+                return ticks
+
+    @property
+    def timers(self):
+        return self.sim.timers
+
+    def snapshot(self):
+        #sim state plus the phase being held, see TrafficSim.snapshot
+        return self.sim.snapshot(), self.current_phase, self.time_remaining
+
+    def restore(self, state):
+        sim_state, self.current_phase, self.time_remaining = state
+        self.sim.restore(sim_state)
+
+    def _frame(self):
+        if self.sim.screen is None:
+            self.sim.init_pygame(offscreen=True)
+        self.sim.draw_screen()
+        return self.sim.render_frame(self.render_size)
+
+    def render(self):
+        if self.render_mode == "rgb_array":
+            return self._frame()
+        if self.render_mode == "rgb_array_list":
+            frames, self.frames = self.frames, []
+            return frames
+        # "human" draws while stepping
+
+    def close(self):
+        if self.sim.recorder is not None:
+            self.sim.recorder.close()
+
     def reset(self, seed=None, options=None):
         super().reset(seed=seed)
+        if seed is not None:
+            self.sim.seed(seed)
         self.sim.reset_vals()
         self.sim.total_time = 0
         self.time_remaining = 0.0
         self.current_phase = 0
+        self.frames = []
+        self.ticks = 0
+        self.last_ticks = 0
+        self.quiet_backoff = 0
+        self.quiet_wait = 1
+        if self.render_mode == "rgb_array_list":
+            self.frames.append(self._frame())
         return self._get_observation(), {}
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""
+to run:
+python traffic_eval.py "data/#12 final/traffic_ppo_final.zip" "data/#12 final/traffic_env_norm_final.pkl"
+
+Scores a checkpoint on the same seeds for every scenario. All episodes of a
+scenario run side by side in one TrafficVecEnv, episode k gets the same
+traffic as TrafficEnv(s, 'normal', seed=seed + k).
+
+A .npz policy from traffic_policy.py export needs no norm file and runs
+without importing stable_baselines3 or torch.
+"""
+
+import argparse
+import os
+import time
+from multiprocessing import Pool
+import numpy as np
+from traffic_batch_sim import BatchedTrafficEnv
+from traffic_policy import NumpyPolicy, load_ppo
+
+SCENARIOS = {1: "normal", 2: "rush hour", 3: "big event"}
+
+# per-episode values that get summarized
+METRICS = ["reward", "waiting_rew", "passed_rew", "num_crashes", "average_wait_time", "cars_passed"]
+
+
+def summarize(values):
+    #mean, sample std and a normal approximation 95% confidence interval
+    values = np.asarray(values, dtype=np.float64)
+    mean = float(values.mean())
+    std = float(values.std(ddof=1)) if len(values) > 1 else 0.0
+    half = 1.96 * std / float(np.sqrt(len(values)))
+    return {"mean": mean, "std": std, "ci95": (mean - half, mean + half)}
+
+
+def run_scenario(model_path, norm_path, s, seeds, dt=1/60, deterministic=True):
+    """
+    Runs one episode per seed of scenario s and returns a dict with an array
+    of per-episode values for every name in METRICS.
+    """
+    waiting_rew = np.zeros(len(seeds))
+    passed_rew = np.zeros(len(seeds))
+
+    if model_path.endswith(".npz"):
+        #normalization is folded into the exported weights
+        vec_env = BatchedTrafficEnv(len(seeds), s, 'normal', seed=list(seeds), dt=dt)
+        model = NumpyPolicy.load(model_path)
+        reset, step = vec_env.reset_all, vec_env.advance
+    else:
+        from stable_baselines3.common.vec_env import VecNormalize
+        from traffic_vec_env import TrafficVecEnv
+
+        vec_env = TrafficVecEnv(len(seeds), s, 'normal', seed=list(seeds), dt=dt)
+        env = vec_env
+        if norm_path:
+            env = VecNormalize.load(norm_path, vec_env)
+            env.training = False
+            env.norm_reward = False
+
+        model = load_ppo(model_path)
+        reset, step = env.reset, lambda action: env.step(action)[:3]
+
+    #every env starts together and has the same length, so they all finish on the same step
+    obs = reset()
+    done = False
+    while not done:
+        action, _ = model.predict(obs, deterministic=deterministic)
+        obs, _, dones = step(action)
+        waiting_rew += vec_env.stats["waiting_rew"]
+        passed_rew += vec_env.stats["passed_rew"]
+        done = dones.all()
+
+    stats = vec_env.stats
+    return {
+        "reward": waiting_rew + passed_rew,
+        "waiting_rew": waiting_rew,
+        "passed_rew": passed_rew,
+        "num_crashes": stats["num_crashes"].astype(np.float64),
+        "average_wait_time": stats["average_wait_time"].copy(),
+        "cars_passed": stats["cars_passed"].astype(np.float64),
+    }
+
+
+def evaluate(model_path, norm_path=None, scenarios=(1, 2, 3), episodes=32, seed=0, dt=1/60, workers=None):
+    """
+    Returns {scenario: {metric: summarize(...)}}. The seeds of every scenario
+    are split into chunks that run in a process pool, one process per core
+    by default. Results don't depend on the number of workers.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    seeds = np.arange(seed, seed + episodes)
+    chunks = min(max(workers // len(scenarios), 1), episodes)
+    jobs = [(model_path, norm_path, s, chunk.tolist(), dt) for s in scenarios for chunk in np.array_split(seeds, chunks)]
+
+    if workers > 1:
+        with Pool(min(workers, len(jobs))) as pool:
+            runs = pool.starmap(run_scenario, jobs)
+    else:
+        runs = [run_scenario(*job) for job in jobs]
+
+    results = {}
+    for i, s in enumerate(scenarios):
+        parts = runs[i * chunks:(i + 1) * chunks]
+        results[s] = {name: summarize(np.concatenate([part[name] for part in parts])) for name in METRICS}
+    return results
+
+
+def report(results):
+    for s, summary in results.items():
+        print(f"Scenario {s} ({SCENARIOS[s]})")
+        for name in METRICS:
+            row = summary[name]
+            low, high = row["ci95"]
+            print(f"  {name:<18} {row['mean']:>10.3f} +- {row['std']:<9.3f} 95% CI [{low:.3f}, {high:.3f}]")
+        print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate a trained traffic light policy")
+    parser.add_argument("model", help="PPO .zip checkpoint, or a .npz from traffic_policy.py export")
+    parser.add_argument("norm", nargs="?", default=None, help="VecNormalize .pkl saved with the model (.zip only)")
+    parser.add_argument("--scenarios", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument("--episodes", type=int, default=32, help="episodes (seeds) per scenario")
+    parser.add_argument("--seed", type=int, default=0, help="first seed")
+    parser.add_argument("--dt", type=float, default=1/60)
+    parser.add_argument("--workers", type=int, default=None, help="processes, defaults to one per core")
+    args = parser.parse_args()
+
+    start = time.time()
+    results = evaluate(args.model, args.norm, args.scenarios, args.episodes, args.seed, args.dt, args.workers)
+    report(results)
+    print(f"Evaluation took {time.time() - start:.2f} seconds")
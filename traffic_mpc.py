@@ -0,0 +1,152 @@
+"""
+to run:
+python traffic_mpc.py --episodes 8 --horizon 10
+
+Search based reference controller to compare PPO checkpoints against. The
+output has the same layout as traffic_eval.py on the same seeds.
+"""
+
+import argparse
+import os
+import time
+from multiprocessing import Pool
+import numpy as np
+from traffic_env import TrafficEnv, DURATIONS
+from traffic_eval import SCENARIOS, METRICS, summarize, report
+
+# the rollout env of this process, made by _init_worker
+_rollout = None
+
+
+def _init_worker(s, r, engine, dt):
+    global _rollout
+    _rollout = TrafficEnv(s, r, engine=engine, macro=True, info="none", fast_forward=True)
+    _rollout.dt = dt
+
+
+def _rollout_return(state, action, horizon, seed):
+    """
+    Reward of holding every phase for durations[action] for horizon seconds
+    from state. seed=None keeps the recorded arrival stream, so the rollout
+    sees the cars that really come next.
+    """
+    env = _rollout
+    env.restore(state)
+    if seed is not None:
+        env.sim.seed(seed)
+    total = 0.0
+    elapsed = 0.0
+    while elapsed < horizon:
+        _, reward, terminated, truncated, _ = env.step(action)
+        total += reward
+        elapsed += env.last_ticks * env.dt
+        if terminated or truncated:
+            break
+    return total
+
+
+class MPCController:
+    """
+    Model predictive control over TrafficEnv.durations. At every phase
+    decision the env's state is snapshotted and each duration is rolled out
+    for horizon seconds on a copy of the sim, the one with the highest
+    return is played. Rollouts run in a process pool, workers=1 runs them
+    in this process.
+
+    With oracle=True the rollouts get the env's own arrival stream, which
+    makes this an upper bound style baseline. oracle=False resamples the
+    arrivals of every rollout from a fresh seed.
+    """
+
+    def __init__(self, s, r, horizon=10.0, workers=None, engine="objects", dt=1/20, oracle=True, seed=None):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.horizon = horizon
+        self.oracle = oracle
+        self.rng = np.random.default_rng(seed)
+        self.pool = None
+        init = (s, r, engine, dt)
+        if workers > 1:
+            self.pool = Pool(workers, initializer=_init_worker, initargs=init)
+        else:
+            _init_worker(*init)
+
+    def act(self, env):
+        #the action only matters when the env is about to pick a new phase
+        if env.time_remaining > 0:
+            return 0
+        state = env.snapshot()
+        seed = None if self.oracle else int(self.rng.integers(2**31))
+        jobs = [(state, action, self.horizon, seed) for action in range(len(DURATIONS))]
+        if self.pool is not None:
+            returns = self.pool.starmap(_rollout_return, jobs)
+        else:
+            returns = [_rollout_return(*job) for job in jobs]
+        return int(np.argmax(returns))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+def run_episode(controller, s, seed, dt=1/60):
+    #one macro episode of TrafficEnv(s, 'normal', seed=seed), returns the values in METRICS
+    env = TrafficEnv(s, 'normal', seed=seed, macro=True, info="episode", fast_forward=True)
+    env.dt = dt
+    env.reset()
+    decisions = []
+    done = False
+    while not done:
+        start = time.perf_counter()
+        action = controller.act(env)
+        decisions.append(time.perf_counter() - start)
+        _, _, terminated, truncated, info = env.step(action)
+        done = terminated or truncated
+    stats = info["stats"]
+    return {
+        "reward": -2 * float(stats["total_wait_time"]) + 50 * float(stats["cars_passed"]),
+        "waiting_rew": -2 * float(stats["total_wait_time"]),
+        "passed_rew": 50 * float(stats["cars_passed"]),
+        "num_crashes": float(stats["num_crashes"]),
+        "average_wait_time": float(stats["average_wait_time"]),
+        "cars_passed": float(stats["cars_passed"]),
+    }, decisions
+
+
+def evaluate(scenarios=(1, 2, 3), episodes=32, seed=0, dt=1/60, horizon=10.0, workers=None, oracle=True):
+    """
+    Same seeds and summary as traffic_eval.evaluate, so the two reports can
+    be read side by side. Also returns the mean seconds per decision.
+    """
+    results = {}
+    latency = []
+    for s in scenarios:
+        controller = MPCController(s, 'normal', horizon=horizon, workers=workers, dt=dt, oracle=oracle, seed=seed)
+        runs = []
+        for k in range(episodes):
+            values, decisions = run_episode(controller, s, seed + k, dt)
+            runs.append(values)
+            latency += decisions
+        controller.close()
+        results[s] = {name: summarize([run[name] for run in runs]) for name in METRICS}
+    return results, float(np.mean(latency))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate the lookahead (MPC) controller")
+    parser.add_argument("--scenarios", type=int, nargs="+", default=[1, 2, 3], choices=list(SCENARIOS))
+    parser.add_argument("--episodes", type=int, default=32, help="episodes (seeds) per scenario")
+    parser.add_argument("--seed", type=int, default=0, help="first seed")
+    parser.add_argument("--dt", type=float, default=1/60)
+    parser.add_argument("--horizon", type=float, default=10.0, help="seconds simulated per rollout")
+    parser.add_argument("--workers", type=int, default=None, help="rollout processes, defaults to one per core")
+    parser.add_argument("--no-oracle", dest="oracle", action="store_false", help="resample arrivals in the rollouts")
+    args = parser.parse_args()
+
+    start = time.time()
+    results, latency = evaluate(args.scenarios, args.episodes, args.seed, args.dt, args.horizon, args.workers, args.oracle)
+    report(results)
+    print(f"{latency * 1000:.1f} ms per decision")
+    print(f"Evaluation took {time.time() - start:.2f} seconds")
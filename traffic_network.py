@@ -0,0 +1,388 @@
+"""
+to run:
+python traffic_network.py --rows 3 --cols 3
+python traffic_network.py --rows 4 --cols 4 --blocks 2 2 --processes --policy data/bad_rf/traffic_policy_bad_rf.npz
+
+A grid of intersections where the cars leaving one intersection drive on
+to the next. Every intersection is a TrafficSim with the same lanes, cars
+and rules as the single intersection, so a policy trained on TrafficEnv
+can be put on each of them as it is.
+
+Cars go straight through: lr cars drive east along their row, rl west, ud
+south down their column and du north. A car leaving a lane enters the same
+lane of the next intersection after link_length pixels of road, the lanes
+that start at the edge of the grid get new cars with probability inflow
+every tick. The front car of a lane follows the last car of the lane it
+drives into, so a queue that backs up to the previous intersection holds
+its cars back.
+
+The grid is split into blocks of intersections, --processes steps every
+block in its own worker process. Cars and queue ends crossing a link are
+passed on once per tick and take effect on the next one, on every link
+the same, so the results don't depend on how the grid is split.
+"""
+
+import argparse
+import bisect
+import time
+import numpy as np
+from gymnasium import spaces
+from traffic_sim import TrafficSim, Car, _neg_distance
+from traffic_arrays import LANE_NAMES, STATS_DTYPE
+from traffic_batch_sim import PHASE_HORIZ, PHASE_VERT
+from traffic_env import DURATIONS, observation_space
+import traffic_workers
+
+# light code -> TrafficSim light
+LIGHT_CHARS = "gyr"
+
+# grid step of each lane's direction, (row, col)
+LANE_STEPS = ((0, 1), (0, -1), (1, 0), (-1, 0))
+
+# inflow per boundary lane and tick, scenario 1 has 1% of ticks bring a car on one of 4 lanes
+DEFAULT_INFLOW = 0.0025
+
+
+class Grid:
+    """Which intersection every lane of every intersection leads to, and comes from."""
+
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.size = rows * cols
+        # downstream[n][k] / upstream[n][k]: the intersection lane k of n leads to / comes from, None at the edge
+        self.downstream = [[self._neighbour(n, k, 1) for k in range(len(LANE_NAMES))] for n in range(self.size)]
+        self.upstream = [[self._neighbour(n, k, -1) for k in range(len(LANE_NAMES))] for n in range(self.size)]
+
+    def _neighbour(self, n, k, sign):
+        row, col = divmod(n, self.cols)
+        row += sign * LANE_STEPS[k][0]
+        col += sign * LANE_STEPS[k][1]
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            return row * self.cols + col
+        return None
+
+    def blocks(self, block_rows, block_cols):
+        #intersection ids of each block, the grid cut into block_rows x block_cols rectangles
+        row_bounds = np.linspace(0, self.rows, block_rows + 1).astype(int)
+        col_bounds = np.linspace(0, self.cols, block_cols + 1).astype(int)
+        return [[row * self.cols + col for row in range(r0, r1) for col in range(c0, c1)]
+                for r0, r1 in zip(row_bounds, row_bounds[1:]) for c0, c1 in zip(col_bounds, col_bounds[1:])]
+
+
+class Intersection(TrafficSim):
+    """
+    A TrafficSim in a grid. createCar adds the cars handed over from the
+    intersections upstream and the boundary inflow instead of sampling a
+    scenario's arrivals.
+    """
+
+    def __init__(self, s, r, inflow, seed=None):
+        super().__init__(s, r, seed=seed, engine="objects")
+        # per lane chance of a new car every tick, 0 for lanes fed by another intersection
+        self.inflow = list(inflow)
+        self.incoming = []
+        self.exits = []
+        #one reusable Car per lane standing in for the last car of the next intersection's lane
+        self.ghosts = [Car(lane, 0.0, self) for lane in LANE_NAMES]
+
+    def reset_vals(self):
+        super().reset_vals()
+        self.incoming = []
+        self.exits = []
+        self.front_leads = [None] * len(self.lanes)
+
+    def createCar(self):
+        for k, distance, speed in self.incoming:
+            self.enter(k, distance, speed)
+        self.incoming = []
+        #one draw per lane every tick, whatever the inflow, so the stream doesn't depend on it
+        draws = self.rng.random(len(LANE_NAMES))
+        for k, p in enumerate(self.inflow):
+            if draws[k] < p:
+                self.add_car(LANE_NAMES[k])
+
+    def enter(self, k, distance, speed):
+        #a car from the intersection upstream, keeps its speed
+        car = Car(LANE_NAMES[k], distance, self)
+        car.speed = speed
+        cars = self.lanes[k]
+        if cars and distance > cars[-1].distance and not self.unsorted[k]:
+            cars.insert(bisect.bisect_right(cars, -distance, key=_neg_distance), car)
+        else:
+            cars.append(car)
+        self.num_cars += 1
+
+    def set_lead(self, k, lead):
+        #lead is (distance, speed) in this lane's coordinates or None
+        if lead is None:
+            self.front_leads[k] = None
+            return
+        ghost = self.ghosts[k]
+        ghost.distance, ghost.speed = lead
+        self.front_leads[k] = ghost
+
+
+class NetworkBlock:
+    """
+    The intersections of one block, stepped together. Hand-offs and queue
+    ends on links inside the block are passed on here, the ones that cross
+    to another block are returned for TrafficNetwork to deliver.
+    """
+
+    def __init__(self, grid, ids, s, r, inflow, link_length, seed=None):
+        self.grid = grid
+        self.ids = list(ids)
+        self.sims = {}
+        for n in self.ids:
+            lane_inflow = [inflow[k] if grid.upstream[n][k] is None else 0.0 for k in range(len(LANE_NAMES))]
+            self.sims[n] = Intersection(s, r, lane_inflow, seed=None if seed is None else seed + n)
+        template = self.sims[self.ids[0]]
+        # a car at distance d past the exit of one intersection is at d - offset in the next one
+        self.offset = template.screen_height + template.car_length + link_length
+        self.left_network = 0
+
+    def reset(self, seed=None):
+        for n, sim in self.sims.items():
+            if seed is not None:
+                sim.seed(seed + n)
+            sim.reset_vals()
+            sim.total_time = 0
+        self.left_network = 0
+        return self.counts()
+
+    def counts(self):
+        return [sim.cars_per_lane() for sim in self.sims.values()]
+
+    def stats(self):
+        return [sim.stats() for sim in self.sims.values()], self.left_network
+
+    def step(self, lights, incoming, leads, dt):
+        """
+        One tick of every intersection. lights is {id: (horiz, vert)} for
+        the ones that change, incoming and leads are the (id, lane, ...)
+        hand-offs and queue ends from other blocks. Returns the rewards and
+        cars per lane of every intersection and the (id, lane, ...) cars and
+        queue ends going to other blocks.
+        """
+        sims = self.sims
+        for n, (horiz, vert) in lights.items():
+            sims[n].horiz_light, sims[n].vert_light = horiz, vert
+        for n, k, distance, speed in incoming:
+            sims[n].incoming.append((k, distance, speed))
+        for n, k, lead in leads:
+            sims[n].set_lead(k, lead)
+
+        rewards = []
+        for sim in sims.values():
+            sim.exits = []
+            reward, _ = sim.step_sim(dt, False, info=False)
+            rewards.append(reward)
+
+        out_cars = []
+        out_leads = []
+        for n, sim in sims.items():
+            downstream = self.grid.downstream[n]
+            for k, distance, speed in sim.exits:
+                m = downstream[k]
+                if m is None:
+                    self.left_network += 1
+                elif m in sims:
+                    sims[m].incoming.append((k, distance - self.offset, speed))
+                else:
+                    out_cars.append((m, k, distance - self.offset, speed))
+            #the last car of each lane is what the front car upstream follows next tick
+            upstream = self.grid.upstream[n]
+            for k, lane in enumerate(sim.lanes):
+                m = upstream[k]
+                if m is None:
+                    continue
+                lead = (lane[-1].distance + self.offset, lane[-1].speed) if lane else None
+                if m in sims:
+                    sims[m].set_lead(k, lead)
+                else:
+                    out_leads.append((m, k, lead))
+        return rewards, self.counts(), out_cars, out_leads
+
+
+def _block_worker(remote, parent_remote, args):
+    parent_remote.close()
+    block = NetworkBlock(*args)
+    while True:
+        cmd, data = remote.recv()
+        if cmd == "close":
+            remote.close()
+            break
+        #step, reset or stats
+        remote.send(getattr(block, cmd)(*data))
+
+
+class TrafficNetwork:
+    """
+    Multi-agent env over a rows x cols grid, one agent per intersection.
+    Intersection n = row * cols + col has the TrafficEnv observation,
+    action space, phase cycle and reward, and all of them step together:
+
+    obs, info = env.reset()                          # obs shape (n, 6)
+    obs, rewards, terminated, truncated, info = env.step(actions)   # actions shape (n,)
+
+    inflow is the chance per tick of a new car on every lane that starts at
+    the edge of the grid, a float or one value per lane (lr, rl, ud, du).
+    blocks=(block_rows, block_cols) splits the grid, processes=True steps
+    each block in its own process. The last step of an episode has the
+    STATS_DTYPE record of every intersection in info["stats"].
+    """
+
+    def __init__(self, rows, cols, s=1, r='normal', seed=None, link_length=300, inflow=DEFAULT_INFLOW,
+                 blocks=(1, 1), processes=False, dt=1/20, start_method=None):
+        self.grid = Grid(rows, cols)
+        self.num_agents = self.grid.size
+        self.dt = dt
+        self.durations = np.array(DURATIONS)
+        self.trial_time = TrafficSim(s, r).trial_time
+        inflow = [inflow] * len(LANE_NAMES) if np.isscalar(inflow) else list(inflow)
+
+        # same spaces as TrafficEnv, for each agent
+        self.observation_space = observation_space()
+        self.action_space = spaces.Discrete(len(DURATIONS))
+
+        self.block_ids = self.grid.blocks(*blocks)
+        self.block_of = {n: b for b, ids in enumerate(self.block_ids) for n in ids}
+        args = [(self.grid, ids, s, r, inflow, link_length, seed) for ids in self.block_ids]
+        self.processes = []
+        if processes:
+            ctx = traffic_workers.context(start_method)
+            self.remotes, work_remotes = zip(*[ctx.Pipe() for _ in args])
+            for remote, work_remote, block_args in zip(self.remotes, work_remotes, args):
+                self.processes.append(traffic_workers.start(ctx, _block_worker, (work_remote, remote, block_args)))
+                work_remote.close()
+            self.blocks = None
+        else:
+            self.blocks = [NetworkBlock(*block_args) for block_args in args]
+
+        self.current_phase = np.zeros(self.num_agents, dtype=np.int64)
+        self.time_remaining = np.zeros(self.num_agents)
+        self.counts = np.zeros((self.num_agents, len(LANE_NAMES)), dtype=np.int64)
+        self.total_time = 0.0
+        self.pending = [([], []) for _ in self.block_ids]
+
+    def _call(self, cmd, data):
+        #calls cmd(*data[b]) on block b, returns every block's answer
+        if self.blocks is not None:
+            return [getattr(block, cmd)(*data[b]) for b, block in enumerate(self.blocks)]
+        for b, remote in enumerate(self.remotes):
+            remote.send((cmd, data[b]))
+        return [remote.recv() for remote in self.remotes]
+
+    def _get_observation(self):
+        obs = np.empty((self.num_agents, 6), dtype=np.float32)
+        obs[:, 0] = self.current_phase
+        obs[:, 1] = self.time_remaining
+        obs[:, 2:] = np.minimum(self.counts, 300)
+        return obs
+
+    def _set_counts(self, counts):
+        for ids, block_counts in zip(self.block_ids, counts):
+            self.counts[ids] = block_counts
+
+    def reset(self, seed=None, options=None):
+        #the blocks were seeded in __init__, without a seed their rng streams go on like TrafficEnv's
+        self._set_counts(self._call("reset", [(seed,)] * len(self.block_ids)))
+        self.current_phase[:] = 0
+        self.time_remaining[:] = 0.0
+        self.total_time = 0.0
+        self.pending = [([], []) for _ in self.block_ids]
+        return self._get_observation(), {}
+
+    def step(self, actions):
+        actions = np.asarray(actions).reshape(self.num_agents)
+        #pick a new phase wherever the last one ran out, like TrafficEnv.step
+        change = np.flatnonzero(self.time_remaining <= 0)
+        self.time_remaining[change] = self.durations[actions[change]]
+        self.current_phase[change] = (self.current_phase[change] + 1) % 4
+        lights = [{} for _ in self.block_ids]
+        for n in change.tolist():
+            phase = self.current_phase[n]
+            lights[self.block_of[n]][n] = (LIGHT_CHARS[PHASE_HORIZ[phase]], LIGHT_CHARS[PHASE_VERT[phase]])
+
+        data = [(lights[b], cars, leads, self.dt) for b, (cars, leads) in enumerate(self.pending)]
+        results = self._call("step", data)
+
+        rewards = np.empty(self.num_agents)
+        self.pending = [([], []) for _ in self.block_ids]
+        for ids, (block_rewards, counts, out_cars, out_leads) in zip(self.block_ids, results):
+            rewards[ids] = block_rewards
+            self.counts[ids] = counts
+            #deliver what crosses to another block on the next step
+            for car in out_cars:
+                self.pending[self.block_of[car[0]]][0].append(car)
+            for lead in out_leads:
+                self.pending[self.block_of[lead[0]]][1].append(lead)
+
+        self.time_remaining = np.maximum(self.time_remaining - self.dt, 0.0)
+        self.total_time += self.dt
+        done = self.total_time >= self.trial_time
+        terminated = np.zeros(self.num_agents, dtype=bool)
+        truncated = np.full(self.num_agents, done)
+        info = {}
+        if done:
+            info["stats"], info["left_network"] = self.stats()
+        return self._get_observation(), rewards, terminated, truncated, info
+
+    def stats(self):
+        #STATS_DTYPE record of every intersection and how many cars drove off the grid
+        records = np.zeros(self.num_agents, dtype=STATS_DTYPE)
+        left = 0
+        for ids, (block_stats, block_left) in zip(self.block_ids, self._call("stats", [()] * len(self.block_ids))):
+            records[ids] = block_stats
+            left += block_left
+        return records, left
+
+    def close(self):
+        if self.blocks is None and self.processes:
+            for remote in self.remotes:
+                remote.send(("close", None))
+            for process in self.processes:
+                process.join()
+            self.processes = []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a grid of intersections")
+    parser.add_argument("--rows", type=int, default=3)
+    parser.add_argument("--cols", type=int, default=3)
+    parser.add_argument("--blocks", type=int, nargs=2, default=[1, 1], metavar=("ROWS", "COLS"))
+    parser.add_argument("--processes", action="store_true", help="one worker process per block")
+    parser.add_argument("--link-length", type=float, default=300, help="pixels of road between two intersections")
+    parser.add_argument("--inflow", type=float, nargs="+", default=[DEFAULT_INFLOW], help="per tick, one value or lr rl ud du")
+    parser.add_argument("--policy", default=None, help=".npz from traffic_policy.py export, fixed 10s phases without one")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    env = TrafficNetwork(args.rows, args.cols, seed=args.seed, link_length=args.link_length,
+                         inflow=args.inflow[0] if len(args.inflow) == 1 else args.inflow,
+                         blocks=tuple(args.blocks), processes=args.processes)
+    if args.policy:
+        from traffic_policy import NumpyPolicy
+        policy = NumpyPolicy.load(args.policy)
+    else:
+        policy = None
+    obs, _ = env.reset()
+    start = time.perf_counter()
+    ticks = 0
+    while True:
+        actions = policy.predict(obs, deterministic=True)[0] if policy else np.full(env.num_agents, DURATIONS.index(10.0))
+        obs, rewards, terminated, truncated, info = env.step(actions)
+        ticks += 1
+        if truncated.all():
+            break
+    took = time.perf_counter() - start
+    env.close()
+
+    stats = info["stats"]
+    for n in range(env.num_agents):
+        row, col = divmod(n, args.cols)
+        print(f"({row},{col}) passed {stats['cars_passed'][n]:4d}  crashes {stats['num_crashes'][n]:3d}  "
+              f"wait per car {stats['average_wait_time'][n]:6.2f}s  queued {stats['cars_per_lane'][n].tolist()}")
+    print(f"{info['left_network']} cars drove off the grid")
+    print(f"{ticks} ticks of {env.num_agents} intersections in {took:.2f}s, {ticks * env.num_agents / took:.0f} intersection ticks/s")
@@ -0,0 +1,78 @@
+import time
+import numpy as np
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv
+from traffic_network import TrafficNetwork
+from traffic_vec_env import TrafficVecEnv
+
+
+class TrafficNetworkVecEnv(TrafficNetwork, VecEnv):
+    """
+    SB3 VecEnv over the intersections of a TrafficNetwork, env n is
+    intersection n. One policy is trained on all of them, each with its own
+    observation and reward. The whole grid ends its episode after
+    trial_time and restarts together, infos of that step are laid out like
+    TrafficVecEnv's.
+    """
+
+    def __init__(self, rows, cols, s, r, seed=None, **kwargs):
+        TrafficNetwork.__init__(self, rows, cols, s, r, seed=seed, **kwargs)
+        self.render_mode = None
+        VecEnv.__init__(self, self.num_agents, self.observation_space, self.action_space)
+
+        self.actions = None
+
+        self.episode_returns = np.zeros(self.num_envs)
+        self.episode_lengths = np.zeros(self.num_envs, dtype=np.int64)
+        self.episode_starts = np.full(self.num_envs, time.time())
+
+    def _start_episode(self):
+        self.episode_returns[:] = 0.0
+        self.episode_lengths[:] = 0
+        self.episode_starts[:] = time.time()
+
+    def reset(self):
+        obs, _ = TrafficNetwork.reset(self, seed=self._seeds[0])
+        self._reset_seeds()
+        self._reset_options()
+        self._start_episode()
+        return obs
+
+    def step(self, actions):
+        return VecEnv.step(self, actions)
+
+    def step_async(self, actions):
+        self.actions = np.asarray(actions).reshape(self.num_envs)
+
+    def step_wait(self):
+        obs, reward, terminated, truncated, info = TrafficNetwork.step(self, self.actions)
+        dones = terminated | truncated
+
+        self.episode_returns += reward
+        self.episode_lengths += 1
+
+        infos = [{} for _ in range(self.num_envs)]
+        if dones.all():
+            for i in range(self.num_envs):
+                infos[i] = self._episode_info(i, info["stats"])
+                infos[i]["terminal_observation"] = obs[i].copy()
+            obs, _ = TrafficNetwork.reset(self)
+            self._start_episode()
+
+        return obs, reward.astype(np.float32), dones, infos
+
+    _episode_info = TrafficVecEnv._episode_info
+
+    def close(self):
+        TrafficNetwork.close(self)
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return [getattr(self, method_name)(*method_args, **method_kwargs) for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
@@ -0,0 +1,160 @@
+"""
+to run:
+python traffic_policy.py export data/bad_rf/traffic_ppo_bad_rf.zip data/bad_rf/traffic_env_norm_bad_rf.pkl data/bad_rf/traffic_policy_bad_rf.npz
+python traffic_policy.py check data/bad_rf/traffic_ppo_bad_rf.zip data/bad_rf/traffic_env_norm_bad_rf.pkl data/bad_rf/traffic_policy_bad_rf.npz
+
+export needs stable_baselines3 and torch, NumpyPolicy only needs numpy,
+so anything that just plays a trained policy starts without importing
+torch (or the tensorflow that tensorboard drags in).
+"""
+
+import argparse
+import time
+import numpy as np
+
+ACTIVATIONS = {
+    "relu": lambda x: np.maximum(x, 0, out=x),
+    "tanh": lambda x: np.tanh(x, out=x),
+}
+
+
+def load_ppo(model_path):
+    #a saved PPO on the cpu, for predicting only
+    from stable_baselines3 import PPO
+
+    #the saved lr schedules are lambdas from traffic_train.py, they aren't needed to predict
+    return PPO.load(model_path, device="cpu", custom_objects={"learning_rate": 0.0, "lr_schedule": lambda _: 0.0})
+
+
+def export(model_path, norm_path, out_path):
+    """
+    Write the actor of a saved PPO MlpPolicy to out_path (.npz). The
+    VecNormalize observation scaling is folded into the first layer and its
+    clipping becomes per-feature bounds on the raw observation, so
+    NumpyPolicy takes observations straight from TrafficEnv.
+    """
+    import pickle
+    import torch.nn as nn
+
+    model = load_ppo(model_path)
+    policy = model.policy
+    layers = [m for m in policy.mlp_extractor.policy_net if isinstance(m, nn.Linear)] + [policy.action_net]
+    activation = policy.activation_fn.__name__.lower()
+    if activation not in ACTIVATIONS:
+        raise ValueError(f"unsupported activation: {policy.activation_fn}")
+    weights = [(layer.weight.detach().double().numpy(), layer.bias.detach().double().numpy()) for layer in layers]
+
+    n_obs = weights[0][0].shape[1]
+    low = np.full(n_obs, -np.inf)
+    high = np.full(n_obs, np.inf)
+    if norm_path:
+        with open(norm_path, "rb") as f:
+            norm = pickle.load(f)
+        if norm.norm_obs:
+            # W @ clip((obs - mean) / std, -c, c) + b
+            #   == (W / std) @ clip(obs, mean - c*std, mean + c*std) + (b - (W / std) @ mean)
+            mean = norm.obs_rms.mean
+            std = np.sqrt(norm.obs_rms.var + norm.epsilon)
+            w, b = weights[0]
+            w = w / std
+            weights[0] = (w, b - w @ mean)
+            low = mean - norm.clip_obs * std
+            high = mean + norm.clip_obs * std
+
+    arrays = {"activation": np.array(activation), "obs_low": low, "obs_high": high}
+    for i, (w, b) in enumerate(weights):
+        arrays[f"w{i}"] = w.T.astype(np.float32)  # (in, out) so a batch is x @ w
+        arrays[f"b{i}"] = b.astype(np.float32)
+    np.savez(out_path, **arrays)
+
+
+class NumpyPolicy:
+    """
+    The actor of an exported PPO policy in plain numpy. predict() has the
+    same signature and return value as PPO.predict for a Discrete action
+    space and takes one observation or a batch, raw TrafficEnv
+    observations (no VecNormalize).
+    """
+
+    def __init__(self, weights, biases, activation="relu", obs_low=None, obs_high=None, seed=None):
+        self.weights = [np.ascontiguousarray(w, dtype=np.float32) for w in weights]
+        self.biases = [np.asarray(b, dtype=np.float32) for b in biases]
+        self.activation = ACTIVATIONS[activation]
+        n_obs = self.weights[0].shape[0]
+        self.obs_low = np.full(n_obs, -np.inf, dtype=np.float32) if obs_low is None else np.asarray(obs_low, dtype=np.float32)
+        self.obs_high = np.full(n_obs, np.inf, dtype=np.float32) if obs_high is None else np.asarray(obs_high, dtype=np.float32)
+        self.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def load(cls, path, seed=None):
+        with np.load(path) as f:
+            n = sum(1 for name in f.files if name.startswith("w"))
+            return cls([f[f"w{i}"] for i in range(n)], [f[f"b{i}"] for i in range(n)],
+                       str(f["activation"]), f["obs_low"], f["obs_high"], seed)
+
+    def logits(self, obs):
+        x = np.clip(np.asarray(obs, dtype=np.float32), self.obs_low, self.obs_high)
+        last = len(self.weights) - 1
+        for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+            x = x @ w
+            x += b
+            if i < last:
+                self.activation(x)
+        return x
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=False):
+        obs = np.asarray(observation)
+        single = obs.ndim == 1
+        logits = self.logits(obs[None] if single else obs)
+        if deterministic:
+            actions = logits.argmax(axis=1)
+        else:
+            #sampling the categorical distribution: argmax of logits plus gumbel noise
+            actions = (logits - np.log(-np.log(self.rng.random(logits.shape)))).argmax(axis=1)
+        return (actions[0] if single else actions), state
+
+
+def check(model_path, norm_path, npz_path, n=10000):
+    #how often the exported policy disagrees with SB3 on observations from the env, and both speeds
+    import pickle
+    from traffic_env import TrafficEnv
+
+    env = TrafficEnv(1, 'normal', seed=0, info="none")
+    obs = [env.reset()[0]]
+    rng = np.random.default_rng(0)
+    for _ in range(n - 1):
+        obs.append(env.step(int(rng.integers(11)))[0])
+    obs = np.array(obs)
+
+    model = load_ppo(model_path)
+    with open(norm_path, "rb") as f:
+        norm = pickle.load(f)
+    expected, _ = model.predict(norm.normalize_obs(obs), deterministic=True)
+
+    policy = NumpyPolicy.load(npz_path)
+    actions, _ = policy.predict(obs, deterministic=True)
+    print(f"{int((actions != expected).sum())} of {n} actions differ")
+
+    start = time.perf_counter()
+    for o in obs[:1000]:
+        policy.predict(o, deterministic=True)
+    print(f"numpy: {(time.perf_counter() - start) * 1e3:.1f} us per single predict")
+    start = time.perf_counter()
+    for o in obs[:1000]:
+        model.predict(norm.normalize_obs(o), deterministic=True)
+    print(f"sb3: {(time.perf_counter() - start) * 1e3:.1f} us per single predict")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a PPO policy to numpy, or check an export")
+    parser.add_argument("command", choices=["export", "check"])
+    parser.add_argument("model", help="PPO .zip checkpoint")
+    parser.add_argument("norm", help="VecNormalize .pkl saved with the model")
+    parser.add_argument("out", help="exported .npz")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export(args.model, args.norm, args.out)
+        print(f"wrote {args.out}")
+    else:
+        check(args.model, args.norm, args.out)
@@ -0,0 +1,215 @@
+import json
+import os
+import numpy as np
+from traffic_arrays import LIGHT_CODES
+
+# one row per tick
+TICK_COLUMNS = {
+    "episode": ("i8", ()),
+    "time": ("f8", ()),
+    "action": ("i2", ()),
+    "horiz_light": ("i1", ()),
+    "vert_light": ("i1", ()),
+    "time_remaining": ("f4", ()),
+    "reward": ("f8", ()),
+    "total_wait_time": ("f8", ()),
+    "num_crashes": ("i8", ()),
+    "cars_passed": ("i8", ()),
+    "cars_per_lane": ("i4", (4,)),
+    "first_car": ("i8", ()),  # row of the tick's first car in the car columns
+}
+
+# one row per car per tick, every lane front car first
+CAR_COLUMNS = {
+    "lane": ("i1", ()),
+    "distance": ("f4", ()),
+    "speed": ("f4", ()),
+}
+
+# episodes.bin, written when an episode ends
+EPISODE_DTYPE = np.dtype([
+    ("episode", "i8"),
+    ("scenario", "i1"),
+    ("first_tick", "i8"),
+    ("num_ticks", "i8"),
+    ("first_car", "i8"),
+    ("num_cars", "i8"),
+])
+
+
+class _Column:
+    #fixed dtype buffer that's appended to its file whenever it fills up
+    def __init__(self, path, dtype, shape, chunk):
+        self.dtype = np.dtype(dtype)
+        self.buffer = np.empty((chunk,) + shape, dtype=self.dtype)
+        self.n = 0
+        self.file = open(path, "ab")
+        self.rows = self.file.tell() // (self.dtype.itemsize * int(np.prod(shape)))
+
+    def append(self, value):
+        if self.n == len(self.buffer):
+            self.flush()
+        self.buffer[self.n] = value
+        self.n += 1
+        self.rows += 1
+
+    def extend(self, values):
+        if self.n + len(values) > len(self.buffer):
+            self.flush()
+            if len(values) > len(self.buffer):
+                self.file.write(np.ascontiguousarray(values, dtype=self.dtype).tobytes())
+                self.rows += len(values)
+                return
+        self.buffer[self.n:self.n + len(values)] = values
+        self.n += len(values)
+        self.rows += len(values)
+
+    def flush(self):
+        self.file.write(self.buffer[:self.n].tobytes())
+        self.file.flush()
+        self.n = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class TrajectoryRecorder:
+    """
+    Streams every tick of a TrafficSim into append-only column files in a
+    directory: one raw fixed dtype file per entry of TICK_COLUMNS (one row
+    per tick) and CAR_COLUMNS (one row per car per tick), plus episodes.bin,
+    the index of where each episode's ticks and cars start.
+
+    Rows are buffered chunk ticks at a time, so memory stays flat however
+    long the run is. Opening an existing directory keeps appending, episode
+    numbers carry on. Read it back with TrajectoryReader.
+
+        env = TrafficEnv(1, 'normal', recorder=TrajectoryRecorder("runs/eval"))
+    """
+
+    def __init__(self, path, chunk=4096):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        layout = {name: [dtype, list(shape)] for name, (dtype, shape) in {**TICK_COLUMNS, **CAR_COLUMNS}.items()}
+        with open(os.path.join(path, "columns.json"), "w") as f:
+            json.dump(layout, f, indent=1)
+
+        self.ticks = {name: _Column(os.path.join(path, name + ".bin"), dtype, shape, chunk)
+                      for name, (dtype, shape) in TICK_COLUMNS.items()}
+        #a tick has a few dozen cars at most, so the car buffers are sized per car
+        self.cars = {name: _Column(os.path.join(path, name + ".bin"), dtype, shape, chunk * 16)
+                     for name, (dtype, shape) in CAR_COLUMNS.items()}
+        self.index = open(os.path.join(path, "episodes.bin"), "ab")
+        self.episode = self.index.tell() // EPISODE_DTYPE.itemsize - 1
+        self.start = None
+
+    def start_episode(self, sim):
+        self.end_episode()
+        self.episode += 1
+        self.start = (sim.scenario, self.ticks["episode"].rows, self.cars["lane"].rows)
+
+    def end_episode(self):
+        if self.start is None:
+            return
+        scenario, first_tick, first_car = self.start
+        self.start = None
+        #a reset with no ticks since the last one isn't an episode, the next one gets its number
+        if self.ticks["episode"].rows == first_tick:
+            self.episode -= 1
+            return
+        row = np.array((self.episode, scenario, first_tick, self.ticks["episode"].rows - first_tick,
+                        first_car, self.cars["lane"].rows - first_car), dtype=EPISODE_DTYPE)
+        self.index.write(row.tobytes())
+        self.index.flush()
+
+    def record(self, sim, reward):
+        if self.start is None:
+            self.start_episode(sim)
+        lane, distance, speed = sim.car_states()
+        ticks = self.ticks
+        ticks["episode"].append(self.episode)
+        ticks["time"].append(sim.total_time)
+        ticks["action"].append(sim.action)
+        ticks["horiz_light"].append(LIGHT_CODES[sim.horiz_light])
+        ticks["vert_light"].append(LIGHT_CODES[sim.vert_light])
+        ticks["time_remaining"].append(sim.time_remaining)
+        ticks["reward"].append(reward)
+        ticks["total_wait_time"].append(sim.total_wait_time)
+        ticks["num_crashes"].append(sim.num_crashes)
+        ticks["cars_passed"].append(sim.cars_passed)
+        ticks["cars_per_lane"].append(np.bincount(lane, minlength=4))
+        ticks["first_car"].append(self.cars["lane"].rows)
+        self.cars["lane"].extend(lane)
+        self.cars["distance"].extend(distance)
+        self.cars["speed"].extend(speed)
+
+    def flush(self):
+        for column in list(self.ticks.values()) + list(self.cars.values()):
+            column.flush()
+
+    def close(self):
+        self.end_episode()
+        for column in list(self.ticks.values()) + list(self.cars.values()):
+            column.close()
+        self.index.close()
+
+
+class TrajectoryReader:
+    """
+    Memory maps a TrajectoryRecorder directory. Nothing is read until it's
+    sliced, so any episode of a huge run can be pulled out on its own.
+
+        reader = TrajectoryReader("runs/eval")
+        ep = reader.episode(3)                      # {column: array}
+        lane, distance, speed = reader.cars(3, 100) # cars on tick 100 of episode 3
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "columns.json")) as f:
+            layout = json.load(f)
+        self.columns = {name: self._map(name, dtype, tuple(shape)) for name, (dtype, shape) in layout.items()}
+        self.episodes = self._map("episodes", EPISODE_DTYPE, ())
+
+    def _map(self, name, dtype, shape):
+        file = os.path.join(self.path, name + ".bin")
+        dtype = np.dtype(dtype)
+        rows = os.path.getsize(file) // (dtype.itemsize * int(np.prod(shape)))
+        if rows == 0:
+            return np.zeros((0,) + shape, dtype=dtype)
+        return np.memmap(file, dtype=dtype, mode="r", shape=(rows,) + shape)
+
+    def __len__(self):
+        return len(self.episodes)
+
+    def episode(self, episode, start=None, stop=None):
+        """
+        Tick columns of one episode as {name: array}, optionally only the
+        ticks with start <= time < stop (seconds into the episode).
+        """
+        ep = self.episodes[episode]
+        first, last = int(ep["first_tick"]), int(ep["first_tick"] + ep["num_ticks"])
+        #time only goes up inside an episode, so a time window is two binary searches
+        time = self.columns["time"][first:last]
+        if start is not None:
+            first += int(np.searchsorted(time, start, "left"))
+        if stop is not None:
+            last = int(ep["first_tick"]) + int(np.searchsorted(time, stop, "left"))
+        return {name: self.columns[name][first:last] for name in TICK_COLUMNS}
+
+    def cars(self, episode, tick):
+        #lane, distance and speed of every car on one tick of an episode
+        ep = self.episodes[episode]
+        if not 0 <= tick < ep["num_ticks"]:
+            raise IndexError(f"episode {episode} has {ep['num_ticks']} ticks")
+        row = int(ep["first_tick"]) + tick
+        first = int(self.columns["first_car"][row])
+        last = first + int(self.columns["cars_per_lane"][row].sum())
+        return tuple(self.columns[name][first:last] for name in CAR_COLUMNS)
+
+    def episode_cars(self, episode):
+        #car columns of a whole episode, a tick's cars start at its first_car minus the episode's
+        ep = self.episodes[episode]
+        first, last = int(ep["first_car"]), int(ep["first_car"] + ep["num_cars"])
+        return {name: self.columns[name][first:last] for name in CAR_COLUMNS}
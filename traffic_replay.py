@@ -0,0 +1,86 @@
+import json
+import numpy as np
+from traffic_env import TrafficEnv
+
+
+class Replay:
+    """
+    Rebuilds a recorded episode from its seed, the action given to every
+    step and that step's dt. Playback needs no model.
+
+    One pass over the episode saves a TrafficSim snapshot every `every`
+    ticks. seek() restores the closest snapshot at or before the target and
+    re-simulates at most `every` ticks, so any point of the run is a few
+    milliseconds away. tick is the number of ticks done, the screen shows
+    the state after the last of them.
+    """
+
+    def __init__(self, s, r, seed, actions, dts, every=100, engine="objects"):
+        if len(actions) != len(dts):
+            raise ValueError("need one dt per action")
+        self.env = TrafficEnv(s, r, engine=engine, info="none")
+        self.seed = seed
+        self.actions = list(actions)
+        self.dts = list(dts)
+        self.every = every
+        #seconds into the episode after each tick, for seek_time
+        self.times = np.cumsum(self.dts)
+
+        self.env.reset(seed=seed)
+        self.tick = 0
+        self.snapshots = []
+        for tick in range(len(self.actions)):
+            if tick % every == 0:
+                self.snapshots.append(self.env.snapshot())
+            self._advance(draw=False)
+        self.seek(0)
+
+    @classmethod
+    def load(cls, path, episode=0, **kwargs):
+        #a file written by traffic_run.py --save
+        with open(path) as f:
+            run = json.load(f)
+        ep = run["episodes"][episode]
+        return cls(run["scenario"], run["reward"], ep["seed"], ep["actions"], ep["dt"], **kwargs)
+
+    def __len__(self):
+        return len(self.actions)
+
+    @property
+    def time(self):
+        return float(self.times[self.tick - 1]) if self.tick else 0.0
+
+    def _advance(self, draw):
+        env = self.env
+        env.dt = self.dts[self.tick]
+        env.step(self.actions[self.tick])
+        self.tick += 1
+        #wrecks fade once a tick, drawn or not, so seeking shows the same frame as playing
+        if draw and env.sim.screen is not None:
+            env.sim.draw_screen()
+        else:
+            env.sim.fade_wrecks()
+
+    def seek(self, tick):
+        tick = min(max(int(tick), 0), len(self))
+        i = max(tick - 1, 0) // self.every
+        self.env.restore(self.snapshots[i])
+        self.tick = i * self.every
+        if self.tick == tick:
+            if self.env.sim.screen is not None:
+                self.env.sim.draw_screen()
+            return
+        self.step(tick - self.tick)
+
+    def seek_time(self, seconds):
+        #first tick that ends at or after seconds
+        self.seek(int(np.searchsorted(self.times, seconds)) + 1 if seconds > 0 else 0)
+
+    def step(self, n=1):
+        #n ticks forward, a negative n goes back through seek
+        if n < 0:
+            self.seek(self.tick + n)
+            return
+        n = min(n, len(self) - self.tick)
+        for k in range(n):
+            self._advance(draw=k == n - 1)
@@ -3,14 +3,27 @@ to run:
 Set-ExecutionPolicy -ExecutionPolicy Bypass -Scope Process
 C:/users/asher/onedrive/desktop/traffic_env/Scripts/Activate.ps1
 python traffic_run.py
+python traffic_run.py --save runs/live.json      (keeps the seed, actions and dt of every episode)
+python traffic_run.py --policy data/bad_rf/traffic_policy_bad_rf.npz      (numpy export, starts without torch)
+python traffic_run.py --replay runs/live.json --episode 0
+
+replay keys:
+space - pause / play
+right / left - one tick forward / back
+up / down - play faster / slower
+page up / page down - 5 seconds forward / back
+home / end, 0-9 - start, end, tenths of the episode
 
 when done:
 deactivate
 """
 
-from stable_baselines3 import PPO
-from stable_baselines3.common.vec_env import DummyVecEnv, VecNormalize
+import argparse
+import json
+import random
 from traffic_env import TrafficEnv
+from traffic_policy import NumpyPolicy, load_ppo
+from traffic_replay import Replay
 import pygame
 
 
@@ -18,35 +31,117 @@ def make_env():
     # 1 - normal
     # 2 - rush hour
     # 3 - big event
-    return TrafficEnv(1, 'normal')
+    return TrafficEnv(1, 'normal', render_mode="human")
+
+
+def load_policy(policy=None):
+    #predict(obs) -> action for one raw TrafficEnv observation
+    if policy and policy.endswith(".npz"):
+        model = NumpyPolicy.load(policy)
+        return lambda obs: model.predict(obs, deterministic=True)[0]
+
+    import pickle
+
+    with open("data/bad_rf/traffic_env_norm_bad_rf.pkl", "rb") as f:
+        norm = pickle.load(f)
+    model = load_ppo(policy or "data/bad_rf/traffic_ppo_bad_rf.zip")
+    return lambda obs: model.predict(norm.normalize_obs(obs), deterministic=True)[0]
+
+
+def live(save=None, seed=None, policy=None):
+    predict = load_policy(policy)
+    env = make_env()
+
+    #every episode is reset with its own seed so it can be replayed
+    if seed is None:
+        seed = random.randrange(2**31)
+    run = {"scenario": env.sim.scenario, "reward": env.sim.reward_function, "episodes": []}
+    episode = {"seed": seed, "actions": [], "dt": []}
+    obs, _ = env.reset(seed=seed)
+
+    env.sim.init_pygame()
+
+    running = True
+    while running:
+        env.dt = env.sim.clock.tick(60) / 1000.0
+
+        action = int(predict(obs))
+        episode["actions"].append(action)
+        episode["dt"].append(env.dt)
+
+        obs, reward, terminated, truncated, info = env.step(action)
+        done = terminated or truncated
 
-venv = DummyVecEnv([lambda: make_env()])
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+                break
 
-venv = VecNormalize.load("data/bad_rf/traffic_env_norm_bad_rf.pkl", venv)
-venv.training = False
-venv.norm_reward = False
+        if done:
+            run["episodes"].append(episode)
+            seed += 1
+            episode = {"seed": seed, "actions": [], "dt": []}
+            obs, _ = env.reset(seed=seed)
 
-model = PPO.load("data/bad_rf/traffic_ppo_bad_rf.zip", env=venv)
-obs = venv.reset()
+    pygame.quit()
+    #the episode that was cut short is kept too
+    if episode["actions"]:
+        run["episodes"].append(episode)
+    if save:
+        with open(save, "w") as f:
+            json.dump(run, f)
+        print(f"saved {len(run['episodes'])} episodes to {save}")
 
-inner = venv.envs[0]
-inner.sim.init_pygame()
-inner.render = True
 
-running = True
-while running:
-    inner.dt = inner.sim.clock.tick(60) / 1000.0
+def replay(path, episode=0, every=100):
+    rep = Replay.load(path, episode, every=every)
+    sim = rep.env.sim
+    sim.init_pygame()
+    rep.seek(0)
 
-    action, _ = model.predict(obs, deterministic=True)
+    keys = {pygame.K_HOME: lambda: rep.seek(0), pygame.K_END: lambda: rep.seek(len(rep)),
+            pygame.K_RIGHT: lambda: rep.step(1), pygame.K_LEFT: lambda: rep.step(-1),
+            pygame.K_PAGEUP: lambda: rep.seek_time(rep.time + 5), pygame.K_PAGEDOWN: lambda: rep.seek_time(rep.time - 5)}
+    playing = True
+    speed = 1  # ticks per frame
+    running = True
+    while running:
+        sim.clock.tick(60)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    playing = not playing
+                elif event.key == pygame.K_UP:
+                    speed = min(speed * 2, 64)
+                elif event.key == pygame.K_DOWN:
+                    speed = max(speed // 2, 1)
+                elif event.key in keys:
+                    #stepping a tick or jumping to a spot pauses, skipping 5s doesn't
+                    if event.key not in (pygame.K_PAGEUP, pygame.K_PAGEDOWN):
+                        playing = False
+                    keys[event.key]()
+                elif pygame.K_0 <= event.key <= pygame.K_9:
+                    rep.seek(len(rep) * (event.key - pygame.K_0) // 10)
+        if playing and rep.tick < len(rep):
+            rep.step(speed)
+        pygame.display.set_caption(f"replay {rep.time:6.2f}s  tick {rep.tick}/{len(rep)}  x{speed}{'' if playing else '  paused'}")
 
-    obs, reward, done, info = venv.step(action)
+    pygame.quit()
 
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-            break
 
-    if done:
-        obs = venv.reset()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch the trained policy, or replay a saved run")
+    parser.add_argument("--save", default=None, help="json file for the seeds, actions and dt of the live run")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the first live episode")
+    parser.add_argument("--policy", default=None, help="PPO .zip (normalized with the bad_rf stats) or a .npz export")
+    parser.add_argument("--replay", default=None, help="json file written by --save")
+    parser.add_argument("--episode", type=int, default=0)
+    parser.add_argument("--every", type=int, default=100, help="ticks between replay snapshots")
+    args = parser.parse_args()
 
-pygame.quit()
\ No newline at end of file
+    if args.replay:
+        replay(args.replay, args.episode, args.every)
+    else:
+        live(args.save, args.seed, args.policy)
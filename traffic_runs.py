@@ -0,0 +1,287 @@
+"""
+to run:
+python traffic_runs.py --list
+python traffic_runs.py 5 7 12 --tag rollout/ep_rew_mean --points 1000
+
+Scalars of every training run, from the tensorboard event files in
+traffic_logs/ and the CSVs exported into data/ (named like tensorboard's
+<run>-tag-<tag>.csv downloads, or reward.csv / length.csv). A run is the "#N" at the
+start of its folder name (or the whole name, like bad_rf), the same run can
+have folders in both places.
+
+Every source file is parsed once into .runs_cache/, one .npy per tag with
+(step, wall_time, value) rows. A cache entry is keyed by the file's size
+and modification time, so a file that's still being written to gets
+parsed again on the next query and everything else is a memory map.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import struct
+import time
+import numpy as np
+
+SCALAR_DTYPE = np.dtype([("step", "i8"), ("wall_time", "f8"), ("value", "f4")])
+
+REWARD_TAG = "rollout/ep_rew_mean"
+
+# tag a CSV export holds, by file name, for the exports that don't end in
+# tensorboard's -tag-<tag>.csv. Any other CSV is skipped
+CSV_TAGS = {"reward.csv": REWARD_TAG, "length.csv": "rollout/ep_len_mean"}
+
+CACHE_DIR = ".runs_cache"
+# part of every cache key, bump it when parsing changes so old entries get parsed again
+CACHE_VERSION = 2
+
+
+def _varint(buf, i):
+    result = shift = 0
+    while True:
+        b = buf[i]
+        i += 1
+        result |= (b & 0x7f) << shift
+        if b < 0x80:
+            return result, i
+        shift += 7
+
+
+def _fields(buf, i, end):
+    #(field number, wire type, value) of a protobuf message, length delimited values are (start, stop)
+    while i < end:
+        key, i = _varint(buf, i)
+        field, wire = key >> 3, key & 7
+        if wire == 0:
+            value, i = _varint(buf, i)
+        elif wire == 1:
+            value = buf[i:i + 8]
+            i += 8
+        elif wire == 2:
+            size, i = _varint(buf, i)
+            value = (i, i + size)
+            i += size
+        elif wire == 5:
+            value = buf[i:i + 4]
+            i += 4
+        else:
+            raise ValueError(f"unsupported protobuf wire type {wire}")
+        yield field, wire, value
+
+
+def _summary_values(buf, start, end):
+    #(tag, value) of each scalar in a Summary message
+    for field, _, (vs, ve) in _fields(buf, start, end):
+        if field != 1:
+            continue
+        tag = value = None
+        for f, wire, v in _fields(buf, vs, ve):
+            if f == 1:
+                tag = buf[v[0]:v[1]].decode()
+            elif f == 2:
+                value = struct.unpack("<f", v)[0]
+            elif f == 8:
+                #tensor summaries keep the number in float_val (5) or double_val (6)
+                for tf, twire, tv in _fields(buf, *v):
+                    if tf == 5:
+                        value = struct.unpack("<f", tv if twire == 5 else buf[tv[0]:tv[0] + 4])[0]
+                    elif tf == 6:
+                        value = struct.unpack("<d", tv if twire == 1 else buf[tv[0]:tv[0] + 8])[0]
+        if tag is not None and value is not None:
+            yield tag, value
+
+
+def read_events(path):
+    """
+    {tag: SCALAR_DTYPE array} of one tfevents file. Reads the whole file
+    and walks its TFRecord framing (length, crc, event, crc) without
+    tensorflow, a record cut off at the end of a file that's still being
+    written is skipped.
+    """
+    rows = {}
+    with open(path, "rb") as f:
+        data = f.read()
+    i = 0
+    while i + 12 <= len(data):
+        size = struct.unpack_from("<Q", data, i)[0]
+        start, end = i + 12, i + 12 + size
+        if end + 4 > len(data):
+            break
+        wall_time, step = 0.0, 0
+        for field, _, value in _fields(data, start, end):
+            if field == 1:
+                wall_time = struct.unpack("<d", value)[0]
+            elif field == 2:
+                step = value
+            elif field == 5:
+                for tag, scalar in _summary_values(data, *value):
+                    rows.setdefault(tag, []).append((step, wall_time, scalar))
+        i = end + 4
+    return {tag: np.array(values, dtype=SCALAR_DTYPE) for tag, values in rows.items()}
+
+
+def csv_tag(path):
+    #tag of a CSV export, None if the file name doesn't tell
+    name = os.path.basename(path)
+    match = re.search(r"-tag-(.+)\.csv$", name)
+    if match:
+        #tensorboard writes the "/" after the tag's section as "_"
+        return match.group(1).replace("_", "/", 1)
+    return CSV_TAGS.get(name)
+
+
+def read_csv(path):
+    #a tensorboard "Wall time,Step,Value" export
+    tag = csv_tag(path)
+    if tag is None:
+        raise ValueError(f"can't tell which tag {path} holds")
+    table = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2)
+    scalars = np.zeros(len(table), dtype=SCALAR_DTYPE)
+    scalars["wall_time"] = table[:, 0]
+    scalars["step"] = table[:, 1]
+    scalars["value"] = table[:, 2]
+    return {tag: scalars}
+
+
+def read_info(path):
+    #the numbers worth comparing out of a run's hand written info.txt
+    with open(path, encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    info = {}
+    patterns = {
+        "training_seconds": r"Training took ([\d.]+) seconds",
+        "crashes_per_minute": r"Average crashes per minute: ([\d.]+)",
+        "wait_time_per_car": r"Average wait time per car: ([\d.]+)",
+        "timesteps_millions": r"([\d.]+) million timesteps",
+    }
+    for name, pattern in patterns.items():
+        match = re.search(pattern, text)
+        if match:
+            info[name] = float(match.group(1))
+    return info
+
+
+def cached_scalars(path, cache_dir=CACHE_DIR):
+    """
+    {tag: array} of a tfevents file or CSV, parsed once and memory mapped
+    from cache_dir afterwards until the file's size or mtime changes.
+    """
+    stat = os.stat(path)
+    key = {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime_ns, "version": CACHE_VERSION}
+    entry = os.path.join(cache_dir, hashlib.sha1(key["path"].encode()).hexdigest()[:16])
+    index_file = os.path.join(entry, "index.json")
+    if os.path.exists(index_file):
+        with open(index_file) as f:
+            index = json.load(f)
+        if index["key"] == key:
+            return {tag: np.load(os.path.join(entry, name), mmap_mode="r") for tag, name in index["tags"].items()}
+
+    scalars = read_csv(path) if path.endswith(".csv") else read_events(path)
+    os.makedirs(entry, exist_ok=True)
+    tags = {}
+    for n, (tag, values) in enumerate(sorted(scalars.items())):
+        tags[tag] = f"{n}.npy"
+        np.save(os.path.join(entry, tags[tag]), values)
+    #the index goes last, a half written entry is never trusted
+    with open(index_file, "w") as f:
+        json.dump({"key": key, "tags": tags}, f)
+    return scalars
+
+
+def run_key(folder):
+    match = re.match(r"#(\d+)", folder)
+    return int(match.group(1)) if match else folder
+
+
+def scan(root="."):
+    """
+    {run: {"folders": [...], "sources": [...], "info": {...}}} for every
+    folder of data/ and traffic_logs/ under root.
+    """
+    runs = {}
+    for parent in ("traffic_logs", "data"):
+        for folder in sorted(glob.glob(os.path.join(root, parent, "*"))):
+            if not os.path.isdir(folder):
+                continue
+            run = runs.setdefault(run_key(os.path.basename(folder)), {"folders": [], "sources": [], "info": {}})
+            run["folders"].append(folder)
+            run["sources"] += sorted(glob.glob(os.path.join(folder, "**", "events.out.tfevents.*"), recursive=True))
+            for path in sorted(glob.glob(os.path.join(folder, "*.csv"))):
+                if csv_tag(path):
+                    run["sources"].append(path)
+                else:
+                    print(f"skipping {path}, name it reward.csv, length.csv or <name>-tag-<tag>.csv")
+            if os.path.exists(os.path.join(folder, "info.txt")):
+                run["info"].update(read_info(os.path.join(folder, "info.txt")))
+    return runs
+
+
+def scalars(run, root=".", runs=None, cache_dir=None):
+    """
+    {tag: array} of one run sorted by step. Where several sources have the
+    same tag, like an event file and the CSV exported from it, the one with
+    the most points wins.
+    """
+    runs = scan(root) if runs is None else runs
+    if run not in runs:
+        raise ValueError(f"unknown run {run!r}, --list shows the runs")
+    cache_dir = os.path.join(root, CACHE_DIR) if cache_dir is None else cache_dir
+    merged = {}
+    for source in runs[run]["sources"]:
+        for tag, values in cached_scalars(source, cache_dir).items():
+            if tag not in merged or len(values) > len(merged[tag]):
+                merged[tag] = values
+    return {tag: values if np.all(np.diff(values["step"]) >= 0) else np.sort(values, order="step")
+            for tag, values in merged.items()}
+
+
+def downsample(values, points):
+    #mean of equal sized chunks of rows, keeps the shape of a curve with any number of points
+    if len(values) <= points:
+        return np.asarray(values["step"]), np.asarray(values["value"], dtype=np.float64)
+    bounds = np.linspace(0, len(values), points + 1).astype(np.int64)[:-1]
+    counts = np.diff(np.append(bounds, len(values)))
+    step = np.add.reduceat(np.asarray(values["step"], dtype=np.float64), bounds) / counts
+    value = np.add.reduceat(np.asarray(values["value"], dtype=np.float64), bounds) / counts
+    return step, value
+
+
+def curves(run_ids, tag=REWARD_TAG, points=1000, root="."):
+    #{run: (step, value)} of tag for each run, downsampled to at most points points
+    runs = scan(root)
+    result = {}
+    for run in run_ids:
+        values = scalars(run, root, runs).get(tag)
+        if values is not None:
+            result[run] = downsample(values, points)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the scalars of training runs")
+    parser.add_argument("runs", nargs="*", help="run numbers (the #N of the folders) or folder names")
+    parser.add_argument("--tag", default=REWARD_TAG)
+    parser.add_argument("--points", type=int, default=1000)
+    parser.add_argument("--root", default=".")
+    parser.add_argument("--list", action="store_true", help="list the runs and their tags")
+    args = parser.parse_args()
+
+    if args.list:
+        runs = scan(args.root)
+        for run, entry in runs.items():
+            tags = scalars(run, args.root, runs)
+            longest = max((len(values) for values in tags.values()), default=0)
+            print(f"#{run}" if isinstance(run, int) else run, f"- {len(tags)} tags, up to {longest} points", entry["info"] or "")
+    else:
+        start = time.perf_counter()
+        try:
+            result = curves([int(r) if r.isdigit() else r for r in args.runs], args.tag, args.points, args.root)
+        except ValueError as e:
+            parser.error(str(e))
+        took = time.perf_counter() - start
+        for run, (step, value) in result.items():
+            print(f"{run}: {len(step)} points, steps {step[0]:.0f}-{step[-1]:.0f}, "
+                  f"last {value[-1]:.2f}, best {value.max():.2f}")
+        print(f"took {took * 1000:.1f} ms")
@@ -0,0 +1,403 @@
+"""
+to run:
+python traffic_server.py serve data/bad_rf/traffic_policy_bad_rf.npz --listen 127.0.0.1:7777
+python traffic_server.py load --connect 127.0.0.1:7777 --sims 1 8 32 128
+python traffic_server.py load --policy data/bad_rf/traffic_policy_bad_rf.npz --sims 1 8 32 128
+
+A decision server for the traffic lights: clients send observations in the
+TrafficEnv._get_observation layout and get back an action and the phase
+duration it stands for. Requests that arrive together from any number of
+connections are answered by one forward pass of a NumpyPolicy.
+
+--listen/--connect take host:port, or a path for a unix socket (not on
+Windows). load steps TrafficEnvs in --procs worker processes, one
+connection per sim, and asks the server whenever a sim's phase runs out.
+
+protocol, little endian:
+request - uint32 n, then n observations of 6 float32
+reply - n of (int32 action, float32 duration)
+n = 0 asks for the stats as uint32 length + JSON, STATS_RESET also resets them
+n above the server's max_batch, or a batch the policy fails on, closes the connection
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from multiprocessing import Pool
+import numpy as np
+from traffic_env import DURATIONS
+from traffic_policy import NumpyPolicy
+
+OBS_SIZE = 6
+OBS_DTYPE = np.dtype("<f4")
+REPLY_DTYPE = np.dtype([("action", "<i4"), ("duration", "<f4")])
+STATS = 0
+STATS_RESET = 0xFFFFFFFF
+
+
+def parse_address(text):
+    #"host:port" -> (host, port), anything else is a unix socket path
+    host, sep, port = text.rpartition(":")
+    if sep and port.isdigit() and "/" not in text:
+        return host or "127.0.0.1", int(port)
+    return text
+
+
+def _percentiles(times):
+    if not len(times):
+        return {}
+    p50, p99 = np.percentile(times, [50, 99]) * 1e6
+    return {"p50_us": float(p50), "p99_us": float(p99), "max_us": float(np.max(times) * 1e6)}
+
+
+class DecisionServer:
+    """
+    Serves policy decisions over a TCP or unix socket. Every request waits
+    in a queue, the batcher takes everything that's queued (up to
+    max_batch observations), runs one predict over all of it and answers
+    each request with its rows. max_delay seconds of waiting after the
+    first request trade latency for bigger batches, 0 never waits.
+
+    start_background() runs the server on its own thread and event loop,
+    which is all a test or the load generator needs.
+    """
+
+    def __init__(self, policy, durations=DURATIONS, max_batch=1024, max_delay=0.0, size=65536):
+        self.policy = policy
+        self.durations = np.asarray(durations, dtype=np.float32)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.latencies = np.zeros(size)  # seconds from a request being read to its reply, last `size` requests
+        self.server = None
+        self.connections = {}  # handler task -> writer of every open connection
+        self.loop = None
+        self.thread = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.observations = 0
+        self.batches = 0
+        self.largest_batch = 0
+
+    def stats(self):
+        seconds = time.perf_counter() - self.started
+        count = min(self.requests, len(self.latencies))
+        return {
+            "seconds": seconds,
+            "requests": self.requests,
+            "observations": self.observations,
+            "batches": self.batches,
+            "mean_batch": self.observations / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "requests_per_s": self.requests / seconds,
+            "observations_per_s": self.observations / seconds,
+            "latency": _percentiles(self.latencies[:count]),
+        }
+
+    def decide(self, obs):
+        #REPLY_DTYPE rows for a (n, OBS_SIZE) batch
+        actions, _ = self.policy.predict(obs, deterministic=True)
+        reply = np.empty(len(obs), dtype=REPLY_DTYPE)
+        reply["action"] = actions
+        reply["duration"] = self.durations[actions]
+        return reply
+
+    async def _batcher(self):
+        while True:
+            batch = [await self.queue.get()]
+            if self.max_delay:
+                await asyncio.sleep(self.max_delay)
+            n = len(batch[0][0])
+            while n < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                n += len(batch[-1][0])
+            obs = batch[0][0] if len(batch) == 1 else np.concatenate([item[0] for item in batch])
+            try:
+                reply = self.decide(obs)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.largest_batch = max(self.largest_batch, n)
+            start = 0
+            for item, future in batch:
+                #the future of a connection that closed meanwhile is cancelled
+                if not future.done():
+                    future.set_result(reply[start:start + len(item)])
+                start += len(item)
+
+    async def _handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        self.connections[task] = writer
+        try:
+            while True:
+                n, = struct.unpack("<I", await reader.readexactly(4))
+                if n in (STATS, STATS_RESET):
+                    body = json.dumps(self.stats()).encode()
+                    if n == STATS_RESET:
+                        self.reset_stats()
+                    writer.write(struct.pack("<I", len(body)) + body)
+                    continue
+                #n comes from the client, don't buffer more than a batch for it
+                if n > self.max_batch:
+                    print(f"closing a connection that sent {n} observations, max_batch is {self.max_batch}")
+                    break
+                data = await reader.readexactly(n * OBS_SIZE * OBS_DTYPE.itemsize)
+                start = time.perf_counter()
+                future = loop.create_future()
+                self.queue.put_nowait((np.frombuffer(data, dtype=OBS_DTYPE).reshape(n, OBS_SIZE), future))
+                try:
+                    reply = await future
+                except Exception as e:
+                    #the reply has no room for an error, the client sees the connection close
+                    print(f"decide failed, closing the connection: {e!r}")
+                    break
+                writer.write(reply.tobytes())
+                self.latencies[self.requests % len(self.latencies)] = time.perf_counter() - start
+                self.requests += 1
+                self.observations += n
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.connections.pop(task, None)
+            writer.close()
+
+    async def start(self, address):
+        self.queue = asyncio.Queue()
+        self.batcher = asyncio.ensure_future(self._batcher())
+        if isinstance(address, tuple):
+            self.server = await asyncio.start_server(self._handle, *address)
+        else:
+            if os.path.exists(address):
+                os.unlink(address)
+            self.server = await asyncio.start_unix_server(self._handle, address)
+        self.reset_stats()
+        return self.server
+
+    async def close(self):
+        #stop listening, then close the open connections and wait for their handlers to see it,
+        #so nothing is left pending when the loop stops. The batcher still answers what's queued
+        self.server.close()
+        handlers = list(self.connections)
+        for writer in self.connections.values():
+            writer.close()
+        await asyncio.gather(*handlers, return_exceptions=True)
+        await self.server.wait_closed()
+        self.batcher.cancel()
+        await asyncio.gather(self.batcher, return_exceptions=True)
+
+    async def serve_forever(self, address):
+        await self.start(address)
+        async with self.server:
+            await self.server.serve_forever()
+
+    def start_background(self, address):
+        #serve from a daemon thread, returns once the socket is listening
+        ready = threading.Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            self.loop.run_until_complete(self.start(address))
+            ready.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+class DecisionClient:
+    """
+    Blocking client. decide() is one round trip, send() and recv() split
+    it up so a caller with several connections can have requests in flight
+    on all of them at once.
+    """
+
+    def __init__(self, address, timeout=None):
+        if isinstance(address, tuple):
+            self.sock = socket.create_connection(address, timeout=timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(address)
+        self.pending = []
+
+    def _recv_exactly(self, size):
+        buf = bytearray(size)
+        view = memoryview(buf)
+        while view:
+            got = self.sock.recv_into(view)
+            if not got:
+                raise ConnectionError("decision server closed the connection")
+            view = view[got:]
+        return buf
+
+    def send(self, obs):
+        obs = np.ascontiguousarray(obs, dtype=OBS_DTYPE).reshape(-1, OBS_SIZE)
+        self.sock.sendall(struct.pack("<I", len(obs)) + obs.tobytes())
+        self.pending.append(len(obs))
+
+    def recv(self):
+        #REPLY_DTYPE rows for the oldest request that was sent
+        n = self.pending.pop(0)
+        return np.frombuffer(self._recv_exactly(n * REPLY_DTYPE.itemsize), dtype=REPLY_DTYPE)
+
+    def decide(self, obs):
+        #(action, duration) for one observation, or arrays of both for a batch
+        single = np.ndim(obs) == 1
+        self.send(obs)
+        reply = self.recv()
+        if single:
+            return int(reply["action"][0]), float(reply["duration"][0])
+        return reply["action"], reply["duration"]
+
+    def stats(self, reset=False):
+        self.sock.sendall(struct.pack("<I", STATS_RESET if reset else STATS))
+        size, = struct.unpack("<I", self._recv_exactly(4))
+        return json.loads(bytes(self._recv_exactly(size)))
+
+    def close(self):
+        self.sock.close()
+
+
+def _load_worker(args):
+    """
+    Steps `sims` TrafficEnvs for `seconds` of wall time. Every tick the
+    sims whose phase ran out send their observation at once, then the
+    replies are read and all sims step.
+    """
+    from traffic_env import TrafficEnv
+
+    address, sims, s, seed, seconds = args
+    envs = [TrafficEnv(s, 'normal', seed=seed + i, info="none") for i in range(sims)]
+    clients = [DecisionClient(address) for _ in range(sims)]
+    obs = [env.reset()[0] for env in envs]
+    actions = [0] * sims
+    latencies = []
+    ticks = 0
+
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        waiting = [i for i, env in enumerate(envs) if env.time_remaining <= 0]
+        sent = []
+        for i in waiting:
+            sent.append(time.perf_counter())
+            clients[i].send(obs[i])
+        for i, start in zip(waiting, sent):
+            actions[i] = int(clients[i].recv()["action"][0])
+            latencies.append(time.perf_counter() - start)
+        for i, env in enumerate(envs):
+            obs[i], _, terminated, truncated, _ = env.step(actions[i])
+            if terminated or truncated:
+                obs[i] = env.reset()[0]
+        ticks += sims
+
+    for client in clients:
+        client.close()
+    return ticks, latencies
+
+
+def load(address, sims=(1, 8, 32, 128), procs=None, s=1, seconds=5.0):
+    """
+    One row per entry of sims: decisions and sim ticks per second over all
+    workers, the round trip seen by the sims and the server's own latency
+    and mean batch size.
+    """
+    procs = procs or os.cpu_count() or 1
+    control = DecisionClient(address)
+    rows = []
+    for n in sims:
+        workers = min(procs, n)
+        split = [n // workers + (i < n % workers) for i in range(workers)]
+        jobs = [(address, k, s, 1000 * i, seconds) for i, k in enumerate(split)]
+        control.stats(reset=True)
+        with Pool(workers) as pool:
+            results = pool.map(_load_worker, jobs)
+        server = control.stats(reset=True)
+        latencies = np.concatenate([np.asarray(lat) for _, lat in results])
+        rows.append({
+            "sims": n,
+            "workers": workers,
+            "decisions_per_s": len(latencies) / seconds,
+            "ticks_per_s": sum(ticks for ticks, _ in results) / seconds,
+            "round_trip": _percentiles(latencies),
+            "server": server,
+        })
+    control.close()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve traffic light decisions from an exported policy, or load test a server")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve_parser = sub.add_parser("serve")
+    serve_parser.add_argument("policy", help=".npz from traffic_policy.py export")
+    serve_parser.add_argument("--listen", default="127.0.0.1:7777", help="host:port or unix socket path")
+    serve_parser.add_argument("--max-batch", type=int, default=1024)
+    serve_parser.add_argument("--max-delay", type=float, default=0.0, help="seconds to wait for a batch to fill")
+    serve_parser.add_argument("--report", type=float, default=10.0, help="seconds between stats lines, 0 for none")
+    load_parser = sub.add_parser("load")
+    load_parser.add_argument("--connect", default="127.0.0.1:7777", help="address of a running server")
+    load_parser.add_argument("--policy", default=None, help="start a server for this .npz in-process instead")
+    load_parser.add_argument("--sims", type=int, nargs="+", default=[1, 8, 32, 128])
+    load_parser.add_argument("--procs", type=int, default=None, help="worker processes, default one per core")
+    load_parser.add_argument("--scenario", type=int, default=1)
+    load_parser.add_argument("--seconds", type=float, default=5.0, help="wall time per row")
+    load_parser.add_argument("--out", default=None, help="json file for the rows")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        server = DecisionServer(NumpyPolicy.load(args.policy), max_batch=args.max_batch, max_delay=args.max_delay)
+
+        async def main():
+            await server.start(parse_address(args.listen))
+            print(f"serving {args.policy} on {args.listen}")
+            async with server.server:
+                while args.report:
+                    await asyncio.sleep(args.report)
+                    stats = server.stats()
+                    server.reset_stats()
+                    print(f"{stats['requests_per_s']:.0f} req/s, {stats['observations_per_s']:.0f} obs/s, "
+                          f"mean batch {stats['mean_batch']:.1f}, latency {stats['latency']}")
+                await server.server.serve_forever()
+
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            pass
+    else:
+        address = parse_address(args.connect)
+        server = None
+        if args.policy:
+            server = DecisionServer(NumpyPolicy.load(args.policy)).start_background(address)
+        rows = load(address, args.sims, args.procs, args.scenario, args.seconds)
+        if server is not None:
+            server.stop()
+        print(f"{'sims':>6} {'decisions/s':>12} {'ticks/s':>10} {'rtt p50':>9} {'rtt p99':>9} {'srv p50':>9} {'srv p99':>9} {'batch':>6}")
+        for row in rows:
+            rtt, srv = row["round_trip"], row["server"]["latency"]
+            print(f"{row['sims']:>6} {row['decisions_per_s']:>12.1f} {row['ticks_per_s']:>10.0f} "
+                  f"{rtt.get('p50_us', 0):>9.1f} {rtt.get('p99_us', 0):>9.1f} "
+                  f"{srv.get('p50_us', 0):>9.1f} {srv.get('p99_us', 0):>9.1f} {row['server']['mean_batch']:>6.2f}")
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(rows, f, indent=1)
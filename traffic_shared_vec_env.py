@@ -0,0 +1,221 @@
+import multiprocessing as mp
+import traceback
+import numpy as np
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv, CloudpickleWrapper
+import traffic_workers
+
+# what a worker does after its start semaphore is released
+STEP = 0
+COMMAND = 1  # read a command from the pipe
+
+
+def _shared(ctx, shape, dtype):
+    #numpy view of a block of shared memory, the block is what gets sent to the workers
+    dtype = np.dtype(dtype)
+    block = ctx.RawArray('b', max(int(np.prod(shape)) * dtype.itemsize, 1))
+    return block, shape, dtype.str
+
+
+def _view(block, shape, dtype):
+    return np.frombuffer(block, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+
+
+def _worker(remote, parent_remote, env_fns, worker, first, start, done, buffers):
+    from stable_baselines3.common.env_util import is_wrapped
+
+    parent_remote.close()
+    envs = [fn() for fn in env_fns.var]
+    command, observations, rewards, dones, actions, has_info, failed = [_view(*b) for b in buffers]
+    while True:
+        start.acquire()
+        if command[0] == STEP:
+            infos = []
+            try:
+                for i, env in enumerate(envs, first):
+                    observation, reward, terminated, truncated, info = env.step(actions[i])
+                    if terminated or truncated:
+                        # same as SubprocVecEnv: keep the last observation, then reset
+                        info["TimeLimit.truncated"] = truncated and not terminated
+                        info["terminal_observation"] = observation
+                        observation, _ = env.reset()
+                    observations[i] = observation
+                    rewards[i] = reward
+                    dones[i] = terminated or truncated
+                    #most steps have no info, only those go through the pipe
+                    has_info[i] = bool(info)
+                    if info:
+                        infos.append(info)
+            except Exception:
+                #the parent is waiting on done, so flag the error and send it instead of dying
+                failed[worker] = True
+                done.release()
+                remote.send(traceback.format_exc())
+                continue
+            done.release()
+            if infos:
+                remote.send(infos)
+            continue
+
+        cmd, data = remote.recv()
+        if cmd == "reset":
+            reset_infos = []
+            for i, env in enumerate(envs, first):
+                seed, options = data[i - first]
+                observation, reset_info = env.reset(seed=seed, **({"options": options} if options else {}))
+                observations[i] = observation
+                reset_infos.append(reset_info)
+            remote.send(reset_infos)
+        elif cmd == "get_attr":
+            remote.send([envs[i - first].get_wrapper_attr(data[1]) for i in data[0]])
+        elif cmd == "set_attr":
+            remote.send([setattr(envs[i - first], data[1], data[2]) for i in data[0]])
+        elif cmd == "env_method":
+            remote.send([envs[i - first].get_wrapper_attr(data[1])(*data[2], **data[3]) for i in data[0]])
+        elif cmd == "is_wrapped":
+            remote.send([is_wrapped(envs[i - first], data[1]) for i in data[0]])
+        elif cmd == "close":
+            for env in envs:
+                env.close()
+            remote.close()
+            break
+
+
+class SharedMemVecEnv(VecEnv):
+    """
+    SubprocVecEnv replacement that moves actions, observations, rewards and
+    dones through shared memory instead of pickling them over a pipe.
+
+    The envs are split over num_workers processes (one per core by default).
+    A step is a semaphore release per worker and an acquire back. Only infos
+    that aren't empty, like the last step of an episode, go through the pipe,
+    so pair it with TrafficEnv(info="none") or info="episode". Everything else
+    (reset, get_attr, env_method, ...) is sent over the pipe like
+    SubprocVecEnv does. Works under VecNormalize.
+    """
+
+    def __init__(self, env_fns, num_workers=None, start_method=None):
+        n_envs = len(env_fns)
+        if num_workers is None:
+            num_workers = mp.cpu_count()
+        num_workers = max(1, min(num_workers, n_envs))
+
+        ctx = traffic_workers.context(start_method)
+
+        #the spaces come from a throwaway env so the shared arrays can be sized before starting workers
+        probe = env_fns[0]()
+        observation_space, action_space = probe.observation_space, probe.action_space
+        probe.close()
+
+        buffers = [
+            _shared(ctx, (1,), np.int64),
+            _shared(ctx, (n_envs,) + observation_space.shape, observation_space.dtype),
+            _shared(ctx, (n_envs,), np.float64),
+            _shared(ctx, (n_envs,), np.bool_),
+            _shared(ctx, (n_envs,) + action_space.shape, action_space.dtype),
+            _shared(ctx, (n_envs,), np.bool_),
+            _shared(ctx, (num_workers,), np.bool_),
+        ]
+        (self.command, self.observations, self.rewards, self.dones, self.actions, self.has_info,
+         self.failed) = [_view(*b) for b in buffers]
+
+        #contiguous chunks of envs, one per worker
+        bounds = np.linspace(0, n_envs, num_workers + 1).astype(int)
+        self.chunks = [range(bounds[w], bounds[w + 1]) for w in range(num_workers)]
+
+        self.starts = [ctx.Semaphore(0) for _ in range(num_workers)]
+        self.dones_sem = [ctx.Semaphore(0) for _ in range(num_workers)]
+        self.remotes, work_remotes = zip(*[ctx.Pipe() for _ in range(num_workers)])
+        self.processes = []
+        for w, chunk in enumerate(self.chunks):
+            fns = CloudpickleWrapper([env_fns[i] for i in chunk])
+            args = (work_remotes[w], self.remotes[w], fns, w, chunk.start, self.starts[w], self.dones_sem[w], buffers)
+            self.processes.append(traffic_workers.start(ctx, _worker, args))
+            work_remotes[w].close()
+        self.closed = False
+
+        # after the workers are up, VecEnv asks them for render_mode
+        super().__init__(n_envs, observation_space, action_space)
+
+    def _send(self, workers, cmd, data):
+        self.command[0] = COMMAND
+        for w in workers:
+            self.remotes[w].send((cmd, data(w)))
+            self.starts[w].release()
+        return [self.remotes[w].recv() for w in workers]
+
+    def reset(self):
+        results = self._send(range(len(self.chunks)), "reset",
+                             lambda w: [(self._seeds[i], self._options[i]) for i in self.chunks[w]])
+        self.reset_infos = [info for infos in results for info in infos]
+        # Seeds and options are only used once
+        self._reset_seeds()
+        self._reset_options()
+        return self.observations.copy()
+
+    def step_async(self, actions):
+        self.actions[:] = np.asarray(actions).reshape(self.actions.shape)
+        self.command[0] = STEP
+        for start in self.starts:
+            start.release()
+
+    def step_wait(self):
+        for done, process in zip(self.dones_sem, self.processes):
+            #a worker that got killed never releases done, SubprocVecEnv would see its pipe close
+            while not done.acquire(timeout=1.0):
+                if not process.is_alive():
+                    raise EOFError(f"SharedMemVecEnv worker {process.pid} died with exit code {process.exitcode}")
+        errors = []
+        infos = [{} for _ in range(self.num_envs)]
+        for w, chunk in enumerate(self.chunks):
+            if self.failed[w]:
+                self.failed[w] = False
+                errors.append(self.remotes[w].recv())
+                continue
+            with_info = [i for i in chunk if self.has_info[i]]
+            if with_info:
+                for i, info in zip(with_info, self.remotes[w].recv()):
+                    infos[i] = info
+        if errors:
+            raise RuntimeError("an env raised in a SharedMemVecEnv worker:\n" + errors[0])
+        return self.observations.copy(), self.rewards.copy(), self.dones.copy(), infos
+
+    def close(self):
+        if self.closed:
+            return
+        self.command[0] = COMMAND
+        for w, remote in enumerate(self.remotes):
+            if self.processes[w].is_alive():
+                remote.send(("close", None))
+                self.starts[w].release()
+        for process in self.processes:
+            process.join()
+        self.closed = True
+
+    def _by_worker(self, indices):
+        #{worker: env indices it holds}
+        if indices is None:
+            indices = range(self.chunks[-1].stop)
+        elif isinstance(indices, int):
+            indices = [indices]
+        workers = {}
+        for i in indices:
+            w = next(w for w, chunk in enumerate(self.chunks) if i in chunk)
+            workers.setdefault(w, []).append(i)
+        return workers
+
+    def _call(self, cmd, indices, *data):
+        workers = self._by_worker(indices)
+        results = self._send(list(workers), cmd, lambda w: (workers[w],) + data)
+        return [value for values in results for value in values]
+
+    def get_attr(self, attr_name, indices=None):
+        return self._call("get_attr", indices, attr_name)
+
+    def set_attr(self, attr_name, value, indices=None):
+        self._call("set_attr", indices, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return self._call("env_method", indices, method_name, method_args, method_kwargs)
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return self._call("is_wrapped", indices, wrapper_class)
@@ -0,0 +1,161 @@
+import json
+import os
+import time
+import gymnasium as gym
+import numpy as np
+from stable_baselines3.common.callbacks import BaseCallback
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def rss_mb(pid=None):
+    #resident memory of a process in MB, None where it can't be read
+    pid = os.getpid() if pid is None else pid
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss / 2**20
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class StepLatency(gym.Wrapper):
+    """
+    Keeps the wall time of the last `size` env.step calls, in seconds.
+    TelemetryCallback reads them from every worker through get_attr, so a
+    slow worker stands out even under SubprocVecEnv.
+    """
+
+    def __init__(self, env, size=4096):
+        super().__init__(env)
+        self.step_times = np.zeros(size)
+        self.step_count = 0
+
+    def step(self, action):
+        start = time.perf_counter()
+        result = self.env.step(action)
+        self.step_times[self.step_count % len(self.step_times)] = time.perf_counter() - start
+        self.step_count += 1
+        return result
+
+
+def _percentiles(times):
+    if not len(times):
+        return {}
+    p50, p90, p99 = np.percentile(times, [50, 90, 99]) * 1e6
+    return {"p50_us": float(p50), "p90_us": float(p90), "p99_us": float(p99), "max_us": float(np.max(times) * 1e6)}
+
+
+class TelemetryCallback(BaseCallback):
+    """
+    Throughput numbers for every PPO iteration, written to TensorBoard
+    under telemetry/ (with the rest of the run in traffic_logs/) and as one
+    JSON line per iteration to path:
+
+    - steps/s of the rollout and of the whole run so far
+    - seconds spent collecting the rollout and in the previous n_epochs update
+    - percentiles of the vec env step time seen from the trainer
+    - per env step time percentiles, when the envs are wrapped in StepLatency
+    - resident memory of the trainer and of the worker processes
+    """
+
+    def __init__(self, path="traffic_logs/telemetry.jsonl", verbose=0):
+        super().__init__(verbose)
+        self.path = path
+        self.file = None
+
+    def _on_training_start(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.file = open(self.path, "a")
+        self.start = time.perf_counter()
+        self.start_steps = self.num_timesteps
+        self.rollout_end = None
+        self.train_seconds = None
+        self.iteration = 0
+        #asking a SubprocVecEnv for a missing attribute kills the worker, so check first
+        self.has_latency = all(self.training_env.env_is_wrapped(StepLatency))
+
+    def _on_rollout_start(self):
+        now = time.perf_counter()
+        #the time since the last rollout ended went to the policy update
+        if self.rollout_end is not None:
+            self.train_seconds = now - self.rollout_end
+        self.rollout_start = now
+        self.rollout_steps = self.num_timesteps
+        self.last_step = now
+        self.vec_step_times = []
+
+    def _on_step(self):
+        now = time.perf_counter()
+        #env step plus the policy forward pass, for all envs at once
+        self.vec_step_times.append(now - self.last_step)
+        self.last_step = now
+        return True
+
+    def _workers(self):
+        #processes behind SubprocVecEnv / SharedMemVecEnv, through any VecEnvWrappers
+        env = self.training_env
+        while hasattr(env, "venv"):
+            env = env.venv
+        return [p.pid for p in getattr(env, "processes", [])]
+
+    def _env_latency(self):
+        if not self.has_latency:
+            return []
+        latencies = self.training_env.get_attr("step_times")
+        counts = self.training_env.get_attr("step_count")
+        return [_percentiles(times[:min(count, len(times))]) for times, count in zip(latencies, counts)]
+
+    def _on_rollout_end(self):
+        now = time.perf_counter()
+        self.rollout_end = now
+        self.iteration += 1
+        rollout_seconds = now - self.rollout_start
+        steps = self.num_timesteps - self.rollout_steps
+
+        record = {
+            "iteration": self.iteration,
+            "timesteps": self.num_timesteps,
+            "elapsed_s": now - self.start,
+            "rollout_s": rollout_seconds,
+            "train_s": self.train_seconds,
+            "rollout_steps_per_s": steps / rollout_seconds if rollout_seconds > 0 else 0.0,
+            "steps_per_s": (self.num_timesteps - self.start_steps) / (now - self.start),
+            "vec_step": _percentiles(self.vec_step_times),
+            "env_step": self._env_latency(),
+            "rss_mb": rss_mb(),
+            "worker_rss_mb": [rss_mb(pid) for pid in self._workers()],
+        }
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+        logger = self.logger
+        logger.record("telemetry/steps_per_s", record["steps_per_s"])
+        logger.record("telemetry/rollout_steps_per_s", record["rollout_steps_per_s"])
+        logger.record("telemetry/rollout_s", rollout_seconds)
+        if self.train_seconds is not None:
+            logger.record("telemetry/train_s", self.train_seconds)
+        for name, value in record["vec_step"].items():
+            logger.record(f"telemetry/vec_step_{name}", value)
+        env_p99 = [row["p99_us"] for row in record["env_step"] if row]
+        if env_p99:
+            #the slowest worker's tail and how far it is from the typical one
+            logger.record("telemetry/env_step_p99_us_max", max(env_p99))
+            logger.record("telemetry/env_step_p99_us_median", float(np.median(env_p99)))
+        if record["rss_mb"] is not None:
+            logger.record("telemetry/rss_mb", record["rss_mb"])
+        workers = [mb for mb in record["worker_rss_mb"] if mb is not None]
+        if workers:
+            logger.record("telemetry/worker_rss_mb_total", sum(workers))
+
+    def _on_training_end(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,65 @@
+import time
+
+# the parts of TrafficSim.step_sim that get timed, in the order they run
+STAGES = ("create", "update", "exit", "crashes", "render", "reward")
+
+
+class StageTimers:
+    """
+    Wall time and call count of every stage of TrafficSim.step_sim, plus
+    how many cars were on the road and how much work checkForCrashes did.
+
+    A sim only pays for this when sim.timers is set, see
+    TrafficEnv(timers=True). Timers add up with +, so the timers of every
+    worker of a vec env can be merged with collect().
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.ns = dict.fromkeys(STAGES, 0)
+        self.calls = dict.fromkeys(STAGES, 0)
+        self.steps = 0
+        self.sim_time = 0.0
+        self.cars = 0  # summed over steps
+        self.pair_checks = 0  # car pairs checkForCrashes compared, objects engine only
+        self.crash_pairs = 0  # overlapping pairs it found
+
+    def lap(self, stage, start):
+        #adds the time since start to stage and returns now, the start of the next stage
+        now = time.perf_counter_ns()
+        self.ns[stage] += now - start
+        self.calls[stage] += 1
+        return now
+
+    def __add__(self, other):
+        total = StageTimers()
+        for timers in (self, other):
+            for stage in STAGES:
+                total.ns[stage] += timers.ns[stage]
+                total.calls[stage] += timers.calls[stage]
+            total.steps += timers.steps
+            total.sim_time += timers.sim_time
+            total.cars += timers.cars
+            total.pair_checks += timers.pair_checks
+            total.crash_pairs += timers.crash_pairs
+        return total
+
+    def report(self):
+        total = sum(self.ns.values()) or 1
+        sim_time = self.sim_time or 1
+        lines = [f"{'stage':<10} {'seconds':>10} {'calls':>10} {'us/call':>9} {'share':>7} {'ms/sim s':>9}"]
+        for stage in STAGES:
+            ns, calls = self.ns[stage], self.calls[stage]
+            per_call = ns / calls / 1e3 if calls else 0.0
+            lines.append(f"{stage:<10} {ns / 1e9:>10.3f} {calls:>10} {per_call:>9.2f} {ns / total:>7.1%} {ns / 1e6 / sim_time:>9.3f}")
+        steps = self.steps or 1
+        lines.append(f"{self.steps} steps, {self.sim_time:.1f} simulated seconds, {self.cars / steps:.1f} cars per step, "
+                     f"{self.pair_checks / steps:.1f} pair checks and {self.crash_pairs / steps:.3f} crash pairs per step")
+        return "\n".join(lines)
+
+
+def collect(vec_env):
+    #merged timers of the TrafficEnvs in a DummyVecEnv, SubprocVecEnv or SharedMemVecEnv, empty for TrafficVecEnv
+    return sum((t for t in vec_env.get_attr("timers") if t is not None), StageTimers())
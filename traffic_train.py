@@ -4,8 +4,9 @@
 from stable_baselines3 import PPO
 from stable_baselines3.common.monitor import Monitor
 from stable_baselines3.common.vec_env import SubprocVecEnv, VecNormalize
-from stable_baselines3.common.callbacks import CheckpointCallback
+from stable_baselines3.common.callbacks import CheckpointCallback, CallbackList
 from traffic_env import TrafficEnv
+from traffic_telemetry import StepLatency, TelemetryCallback
 import torch
 import torch.nn as nn
 import time
@@ -19,8 +20,12 @@ def make_env(id=0):
         # 1 - normal
         # 2 - rush hour
         # 3 - big event
-        env = TrafficEnv(1, 'normal', seed=id)
-        return Monitor(env)
+        # Monitor only needs the rewards, so skip the per-step info dict
+        env = TrafficEnv(1, 'normal', seed=id, info="none")
+        # macro=True makes each step one light decision instead of one tick
+        # env = TrafficEnv(1, 'normal', seed=id, macro=True, info="none")
+        # StepLatency lets TelemetryCallback see each worker's step times
+        return Monitor(StepLatency(env))
     return _init
 
 if __name__ == "__main__":
@@ -35,6 +40,12 @@ if __name__ == "__main__":
 
     # Vectorized environments for parallel training
     env = SubprocVecEnv([make_env(i) for i in range(num_envs)])
+    # or move steps through shared memory instead of pipes:
+    # from traffic_shared_vec_env import SharedMemVecEnv
+    # env = SharedMemVecEnv([make_env(i) for i in range(num_envs)])
+    # or run hundreds of intersections in this one process:
+    # from traffic_vec_env import TrafficVecEnv
+    # env = TrafficVecEnv(256, 1, 'normal', seed=0)
     env = VecNormalize(env, norm_obs=True, norm_reward=True, clip_obs=10.)
 
     policy_kwargs = dict(
@@ -67,7 +78,11 @@ if __name__ == "__main__":
     )
 
     start = time.time()
-    model.learn(total_timesteps=10_000_000, callback=checkpoint_callback)
+    # steps/s, rollout vs update time, step latency and memory, live in
+    # tensorboard under telemetry/ and in traffic_logs/telemetry.jsonl
+    telemetry_callback = TelemetryCallback("traffic_logs/telemetry.jsonl")
+
+    model.learn(total_timesteps=10_000_000, callback=CallbackList([checkpoint_callback, telemetry_callback]))
     end = time.time()
 
     print(f"Training took {end - start:.2f} seconds")
@@ -0,0 +1,106 @@
+import time
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv
+from traffic_batch_sim import BatchedTrafficEnv
+from traffic_env import DURATIONS, observation_space
+
+LIGHT_NAMES = np.array(["g", "y", "r"])
+
+
+class TrafficVecEnv(BatchedTrafficEnv, VecEnv):
+    """
+    SB3 VecEnv that runs num_envs TrafficEnv intersections in one process
+    on a single BatchedTrafficSim, the stepping is BatchedTrafficEnv's.
+
+    Works as a drop-in for SubprocVecEnv([make_env(i) ...]) in
+    traffic_train.py, VecNormalize included. Each env ends its episode after
+    trial_time and restarts on its own. The info of a finished episode has
+    the TrafficEnv info keys plus the "episode" entry Monitor would add.
+    The stacked stats of the last step for every env are in self.stats.
+    """
+
+    def __init__(self, num_envs, s, r, seed=None, dt=1/20):
+        BatchedTrafficEnv.__init__(self, num_envs, s, r, seed=seed, dt=dt)
+        self.render_mode = None
+
+        # same spaces as TrafficEnv
+        VecEnv.__init__(self, num_envs, observation_space(), spaces.Discrete(len(DURATIONS)))
+
+        self.actions = None
+
+        self.episode_returns = np.zeros(num_envs)
+        self.episode_lengths = np.zeros(num_envs, dtype=np.int64)
+        self.episode_starts = np.full(num_envs, time.time())
+
+    def _reset_envs(self, envs):
+        BatchedTrafficEnv._reset_envs(self, envs)
+        self.episode_returns[envs] = 0.0
+        self.episode_lengths[envs] = 0
+        self.episode_starts[envs] = time.time()
+
+    def reset(self):
+        if self._seeds[0] is not None:
+            self.sim.seed(self._seeds)
+        self._reset_seeds()
+        self._reset_options()
+        self._reset_envs(np.arange(self.num_envs))
+        return self._get_observation()
+
+    def step_async(self, actions):
+        self.actions = np.asarray(actions).reshape(self.num_envs)
+
+    def step_wait(self):
+        obs, reward, dones = self.advance(self.actions)
+
+        self.episode_returns += reward
+        self.episode_lengths += 1
+
+        infos = [{} for _ in range(self.num_envs)]
+        done_envs = np.flatnonzero(dones)
+        for i in done_envs.tolist():
+            infos[i] = self._episode_info(i)
+            infos[i]["terminal_observation"] = obs[i].copy()
+        if done_envs.size:
+            self._reset_envs(done_envs)
+            obs[done_envs] = self._get_observation()[done_envs]
+
+        return obs, reward.astype(np.float32), dones, infos
+
+    def _episode_info(self, i, stats=None):
+        stats = self.stats if stats is None else stats
+        return {
+            "vert_light": str(LIGHT_NAMES[stats["vert_light"][i]]),
+            "horiz_light": str(LIGHT_NAMES[stats["horiz_light"][i]]),
+            "total_wait_time": float(stats["total_wait_time"][i]),
+            "average_wait_time": float(stats["average_wait_time"][i]),
+            "wait_diff": float(stats["wait_diff"][i]),
+            "num_crashes": int(stats["num_crashes"][i]),
+            "new_crashes": int(stats["new_crashes"][i]),
+            "cars_passed": int(stats["cars_passed"][i]),
+            "cars_per_lane": stats["cars_per_lane"][i].tolist(),
+            "waiting_rew": float(stats["waiting_rew"][i]),
+            "passed_rew": float(stats["passed_rew"][i]),
+            "TimeLimit.truncated": True,
+            "episode": {
+                "r": round(float(self.episode_returns[i]), 6),
+                "l": int(self.episode_lengths[i]),
+                "t": round(time.time() - self.episode_starts[i], 6),
+            },
+        }
+
+    def close(self):
+        pass
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return [getattr(self, method_name)(*method_args, **method_kwargs) for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
+
@@ -0,0 +1,15 @@
+import multiprocessing as mp
+
+
+def context(start_method=None):
+    #forkserver where the platform has it, spawn otherwise, the same default as SB3's SubprocVecEnv
+    if start_method is None:
+        start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+    return mp.get_context(start_method)
+
+
+def start(ctx, target, args):
+    #daemon, so a main process that crashes doesn't leave its workers running and hanging
+    process = ctx.Process(target=target, args=args, daemon=True)
+    process.start()
+    return process